@@ -6,6 +6,11 @@
 """
 
 import os
+import asyncio
+# 在导入numpy之前限制OpenMP/MKL线程数，避免与ORT的intra-op线程池争抢CPU
+os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 2) // 2)))
+os.environ.setdefault("MKL_NUM_THREADS", os.environ["OMP_NUM_THREADS"])
+
 import time
 import tempfile
 import shutil
@@ -13,12 +18,9 @@ from pathlib import Path
 from typing import Optional, List
 import uuid
 
-import torch
-import onnxruntime
 import numpy as np
 import soundfile as sf
 from tqdm import tqdm
-from librosa import istft
 from loguru import logger
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
@@ -28,7 +30,10 @@ from pydantic import BaseModel, Field
 import uvicorn
 
 # 导入音频预处理模块
-from utils.audio_preprocessing import preprocess_audio_if_needed, cleanup_temp_file as cleanup_audio_temp_file
+from utils.audio_preprocessing import load_audio_if_needed
+from utils.onnx_session import find_model_pair, create_session, create_runner_pool, acquire_runner
+from utils.stft import HOP_LENGTH, num_frames, stft, stft_file, istft
+from utils.buffer_pool import BUFFER_POOL
 
 # 全局变量
 app = FastAPI(
@@ -50,6 +55,8 @@ app.add_middleware(
 
 # 全局变量
 session = None
+chunk_session = None
+runner_pool = None
 basedir = None
 temp_dir = None
 
@@ -78,20 +85,47 @@ class HealthResponse(BaseModel):
 # 启动时间记录
 start_time = time.time()
 
-def init_model():
-    """初始化ONNX模型"""
-    global session, basedir, temp_dir
+# 上传文件落盘时每次拷贝的块大小（1 MiB）
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+def init_model(pool_size=None, intra_op_num_threads=None):
+    """
+    初始化ONNX模型
+    
+    参数:
+        pool_size (int, optional): 执行器池大小（并发推理上限），默认读取环境变量API_POOL_SIZE，未设置时为2
+        intra_op_num_threads (int, optional): 每个会话的intra-op线程数，默认读取环境变量API_INTRA_OP_THREADS，
+                                              未设置时在执行器间平分物理核
+    """
+    global session, chunk_session, runner_pool, basedir, temp_dir
     
     print('正在初始化音频分离模块...')
     
-    # 模型文件路径
-    model_file = "stream/onnx_models/pytorch_model_simple.onnx"
+    # 模型文件路径（由export2onnx.py导出）：优先使用离线图优化后的INT8动态量化模型，依次回退到INT8、FP32模型；
+    # 分块模型一次推理多帧以摊薄调用开销，与单帧模型取自同一精度档次，没有同档次的分块模型时逐帧推理
+    model_file, chunk_model_file = find_model_pair("stream/onnx_models/pytorch_model", chunk_size=8)
+    
+    if model_file is None:
+        raise FileNotFoundError("模型文件不存在: stream/onnx_models/pytorch_model_int8_opt.onnx、pytorch_model_int8.onnx 或 pytorch_model_simple.onnx")
+    
+    # 并发推理上限（执行器池大小）与intra-op线程数分别配置：默认小池子，物理核在各执行器间平分，
+    # 避免满载时ORT自旋线程数超过核数
+    if pool_size is None:
+        pool_size = int(os.environ.get("API_POOL_SIZE", 2))
+    pool_size = max(1, pool_size)
+    if intra_op_num_threads is None:
+        intra_op_num_threads = int(os.environ.get("API_INTRA_OP_THREADS", 0)) or (os.cpu_count() or 2) // 2 // pool_size
+    intra_op_num_threads = max(1, intra_op_num_threads)
+    
+    # 创建ONNX推理会话（开启图优化、线程与内存池配置；执行提供者由环境变量ORT_PROVIDERS指定，默认CPU）
+    session = create_session(model_file, intra_op_num_threads=intra_op_num_threads)
     
-    if not os.path.exists(model_file):
-        raise FileNotFoundError(f"模型文件不存在: {model_file}")
+    if chunk_model_file:
+        chunk_session = create_session(chunk_model_file, intra_op_num_threads=intra_op_num_threads)
     
-    # 创建ONNX推理会话
-    session = onnxruntime.InferenceSession(model_file, None, providers=['CPUExecutionProvider'])
+    # 流式推理执行器池：每个并发请求占用一个执行器，缓存与IOBinding缓冲区跨请求复用
+    # 池大小即并发推理上限；会话保持ORT_SEQUENTIAL，由请求级并发与intra-op线程共同利用CPU
+    runner_pool = create_runner_pool(session, chunk_session, size=pool_size)
     
     # 获取项目根目录
     basedir = os.path.abspath(os.path.dirname(__file__))
@@ -115,7 +149,7 @@ def init_model():
     
     print('音频分离模块初始化完成.')
 
-def inference(source_file: str, save_file: str, samplerate: int = 16000) -> dict:
+def inference(source_file: str, save_file: str, samplerate: int = 16000, verbose: bool = False) -> dict:
     """
     音频降噪推理函数
     
@@ -123,6 +157,7 @@ def inference(source_file: str, save_file: str, samplerate: int = 16000) -> dict
         source_file (str): 输入音频文件路径
         save_file (str): 输出音频文件路径  
         samplerate (int): 采样率
+        verbose (bool): 是否显示逐帧进度条（服务路径默认关闭，避免tqdm的逐帧开销）
         
     返回:
         dict: 处理结果信息
@@ -130,50 +165,50 @@ def inference(source_file: str, save_file: str, samplerate: int = 16000) -> dict
     if session is None:
         raise RuntimeError("模型未初始化")
     
-    T_list = []  # 记录每帧处理时间
-    outputs = []  # 存储每帧的输出结果
-    temp_audio_file = None  # 临时音频文件路径
+    T_list = []  # 记录每次推理调用的处理时间
+    buffers = []  # 从缓冲区池借出的工作数组，结束时归还
 
     try:
-        # 音频预处理：转换为16kHz
+        # 音频预处理：需要转换时直接得到16kHz单声道波形（不写临时文件），否则分块读取原文件
         logger.info(f"开始音频预处理: {source_file}")
-        processed_file, is_temp = preprocess_audio_if_needed(source_file, samplerate)
-        if is_temp:
-            temp_audio_file = processed_file
-            logger.info(f"音频已预处理为16kHz: {processed_file}")
+        wav = load_audio_if_needed(source_file, samplerate)
+        if wav is not None:
+            logger.info("音频已转换为16kHz单声道")
+            T = num_frames(len(wav))
+            inputs = BUFFER_POOL.get((T, 257, 2))
+            buffers.append(inputs)
+            stft(wav, out=inputs)
         else:
             logger.info("音频采样率已符合要求，跳过预处理")
-        
-        # 读取预处理后的音频文件并转换为张量
-        x = torch.from_numpy(sf.read(processed_file, dtype='float32')[0])
-        # 对音频进行短时傅里叶变换(STFT)，转换为频域表示
-        x = torch.stft(x, 512, 256, 512, torch.hann_window(512).pow(0.5), return_complex=False)[None]
-
-        # 初始化模型缓存，用于流式处理
-        conv_cache = np.zeros([2, 1, 16, 16, 33], dtype="float32")  # 卷积层缓存
-        tra_cache = np.zeros([2, 3, 1, 1, 16], dtype="float32")     # Transformer缓存
-        inter_cache = np.zeros([2, 1, 33, 16], dtype="float32")     # 中间层缓存
+            # 分块读取音频并直接做短时傅里叶变换(STFT)，得到 (T, 257, 2) 频谱，
+            # 不在内存中保留整段波形
+            with sf.SoundFile(source_file) as f:
+                T = num_frames(f.frames)
+                inputs = BUFFER_POOL.get((T, 257, 2))
+                buffers.append(inputs)
+                stft_file(f, out=inputs)
 
-        inputs = x.numpy()
-        # 逐帧处理音频数据
-        for i in tqdm(range(inputs.shape[-2]), desc="处理音频帧"):
-            tic = time.perf_counter()
-            
-            # 运行ONNX模型推理，输入当前帧和缓存状态
-            out_i, conv_cache, tra_cache, inter_cache \
-                    = session.run([], {'mix': inputs[..., i:i+1, :],
-                        'conv_cache': conv_cache,
-                        'tra_cache': tra_cache,
-                        'inter_cache': inter_cache})
+        # 进度条仅在verbose时启用，否则直接迭代
+        progress = tqdm if verbose else (lambda steps, **_: steps)
+        # 预分配输出频谱，推理结果按帧直接写入，省去逐帧列表与最后的拼接拷贝
+        outputs = BUFFER_POOL.get((T, 257, 2))
+        buffers.append(outputs)
+        # 从执行器池取出流式推理执行器（缓存已清零），缓存与输入输出缓冲区跨请求复用
+        with acquire_runner(runner_pool) as runner:
+            # 分块处理：整块的帧每次推理N帧，不足一块的尾帧逐帧处理
+            for i, n in progress(runner.steps(T), desc="处理音频帧"):
+                tic = time.perf_counter()
+                
+                # 运行ONNX模型推理，缓存在执行器内部传递，结果写入输出频谱对应帧
+                runner.run(inputs[i:i+n], out=outputs[i:i+n])
 
-            toc = time.perf_counter()
-            T_list.append(toc-tic)  # 记录处理时间
-            outputs.append(out_i)   # 保存输出结果
+                toc = time.perf_counter()
+                T_list.append(toc-tic)  # 记录处理时间
 
-        # 将所有帧的输出结果拼接
-        outputs = np.concatenate(outputs, axis=2)
         # 将频域结果转换回时域音频信号
-        enhanced = istft(outputs[...,0] + 1j * outputs[...,1], n_fft=512, hop_length=256, win_length=512, window=np.hanning(512)**0.5)
+        enhanced = BUFFER_POOL.get((HOP_LENGTH * (T - 1),))
+        buffers.append(enhanced)
+        istft(outputs, out=enhanced)
         
         # 确保输出目录存在
         output_dir = os.path.dirname(save_file)
@@ -181,13 +216,14 @@ def inference(source_file: str, save_file: str, samplerate: int = 16000) -> dict
             os.makedirs(output_dir, exist_ok=True)
             
         # 保存降噪后的音频文件
-        sf.write(save_file, enhanced.squeeze(), samplerate)
+        # enhanced已是一维float32，显式指定WAV/PCM_16，由libsndfile直接完成float32->int16转换
+        sf.write(save_file, enhanced, samplerate, format='WAV', subtype='PCM_16')
         
         return {
             "success": True,
             "message": "降噪处理完成",
             "processing_times": T_list,
-            "total_frames": len(T_list)
+            "total_frames": T
         }
         
     except Exception as e:
@@ -199,9 +235,20 @@ def inference(source_file: str, save_file: str, samplerate: int = 16000) -> dict
             "total_frames": 0
         }
     finally:
-        # 清理临时音频文件
-        if temp_audio_file:
-            cleanup_audio_temp_file(temp_audio_file)
+        # 归还工作数组
+        for buf in buffers:
+            BUFFER_POOL.put(buf)
+
+def save_upload_file(upload_file, file_path: str):
+    """
+    将上传文件按块写入磁盘（在工作线程中执行，避免阻塞事件循环）
+    
+    参数:
+        upload_file: 上传文件对象（UploadFile.file）
+        file_path (str): 保存路径
+    """
+    with open(file_path, "wb") as buffer:
+        shutil.copyfileobj(upload_file, buffer, UPLOAD_CHUNK_SIZE)
 
 def cleanup_temp_file(file_path: str):
     """清理临时文件"""
@@ -272,8 +319,8 @@ async def denoise_audio(request: DenoiseRequest):
     start_time = time.time()
     
     try:
-        # 执行降噪处理
-        result = inference(request.input_file, output_file, request.samplerate)
+        # 执行降噪处理：在工作线程中运行，ORT会话线程安全，并发请求各自占用执行器池中的一个执行器
+        result = await asyncio.to_thread(inference, request.input_file, output_file, request.samplerate)
         
         # 计算处理时间
         processing_time = time.time() - start_time
@@ -330,15 +377,14 @@ async def denoise_upload(
     temp_output = os.path.join(temp_dir, f"output_{temp_id}_{file.filename}")
     
     try:
-        # 保存上传的文件
-        with open(temp_input, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
+        # 保存上传的文件：在线程中按1 MiB分块拷贝，事件循环可继续处理其他请求
+        await asyncio.to_thread(save_upload_file, file.file, temp_input)
         
         # 记录开始时间
         start_time = time.time()
         
-        # 执行降噪处理
-        result = inference(temp_input, temp_output, samplerate)
+        # 执行降噪处理：在工作线程中运行，不阻塞事件循环
+        result = await asyncio.to_thread(inference, temp_input, temp_output, samplerate)
         
         # 计算处理时间
         processing_time = time.time() - start_time
@@ -1,42 +1,153 @@
 import os
 import time
+import numpy as np
 import onnx
 from onnxsim import simplify
+import onnxruntime
+from onnxruntime.quantization import quantize_dynamic, QuantType
 import torch
+from safetensors.torch import load_file, save_file
 import soundfile as sf
 from gtcrn import GTCRN
 from stream.modules.convert import convert_to_stream
-from stream.gtcrn_stream import StreamGTCRN
+from stream.gtcrn_stream import StreamGTCRN, ChunkStreamGTCRN
 
 source_model = "/work/cjh/gtcrn/stream/onnx_models/pytorch_model.bin"
+# safetensors copy of source_model, converted once and loaded without unpickling
+source_safetensors = source_model.split('.bin')[0] + '.safetensors'
 save_model = "/work/cjh/gtcrn/stream/onnx_models/pytorch_model.onnx"
+# 分块模型一次处理chunk_size帧，推理时剩余不足一块的尾帧由单帧模型处理
+chunk_size = 8
+save_chunk_model = save_model.split('.onnx')[0] + f'_chunk{chunk_size}.onnx'
 
 device = torch.device("cpu")
 
-model = GTCRN().to(device).eval()
-# model.load_state_dict(torch.load(source_model, map_location=device)['model'])
-model.load_state_dict(torch.load(source_model, map_location=device))
-stream_model = StreamGTCRN().to(device).eval()
-convert_to_stream(stream_model, model)
-
-conv_cache = torch.zeros(2, 1, 16, 16, 33).to(device)
-tra_cache = torch.zeros(2, 3, 1, 1, 16).to(device)
-inter_cache = torch.zeros(2, 1, 33, 16).to(device)
-
-input = torch.randn(1, 257, 1, 2, device=device)
-torch.onnx.export(stream_model,
-                (input, conv_cache, tra_cache, inter_cache),
-                save_model,
-                input_names = ['mix', 'conv_cache', 'tra_cache', 'inter_cache'],
-                output_names = ['enh', 'conv_cache_out', 'tra_cache_out', 'inter_cache_out'],
-                opset_version=11,
-                verbose = False)
-
-onnx_model = onnx.load(save_model)
-onnx.checker.check_model(onnx_model)
-
-# simplify onnx model
-if not os.path.exists(save_model.split('.onnx')[0]+'_simple.onnx'):
-    model_simp, check = simplify(onnx_model)
-    assert check, "Simplified ONNX model could not be validated"
-    onnx.save(model_simp, save_model.split('.onnx')[0] + '_simple.onnx')
\ No newline at end of file
+
+def is_stale(src, dst):
+    """dst does not exist or is older than src"""
+    return not os.path.exists(dst) or os.path.getmtime(dst) < os.path.getmtime(src)
+
+
+def to_safetensors(state_dict):
+    """
+    safetensors refuses non-contiguous tensors and tensors sharing storage,
+    e.g. ERB.ierb_fc.weight is a transposed view of erb_fc.weight; store an independent contiguous copy of each
+    """
+    return {k: v.contiguous().clone() for k, v in state_dict.items()}
+
+
+def convert_checkpoint(src, dst):
+    """convert a pickled state dict checkpoint to safetensors"""
+    save_file(to_safetensors(torch.load(src, map_location="cpu")), dst)
+
+
+def optimize_offline(src, dst):
+    """run ORT graph optimization once and persist the fused graph, so servers skip the rewrite at load time"""
+    so = onnxruntime.SessionOptions()
+    # EXTENDED keeps the saved graph hardware independent; NCHWc layout transforms stay online
+    so.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    so.optimized_model_filepath = dst
+    onnxruntime.InferenceSession(src, so, providers=['CPUExecutionProvider'])
+
+
+# max abs deviation of 'enh' allowed between a derived model and the fp32 simplified model
+parity_tolerance = 1e-2
+
+
+def check_parity(ref_file, test_file, num_frames, steps=4):
+    """
+    load test_file in ORT and compare it against ref_file over a few streaming steps (caches fed back);
+    return True if it runs and 'enh' stays within parity_tolerance
+    """
+    try:
+        ref = onnxruntime.InferenceSession(ref_file, providers=['CPUExecutionProvider'])
+        test = onnxruntime.InferenceSession(test_file, providers=['CPUExecutionProvider'])
+    except Exception as e:
+        print(f"{test_file} cannot be loaded by onnxruntime: {e}")
+        return False
+    rng = np.random.default_rng(0)
+    ref_inputs = {'conv_cache': np.zeros((2, 1, 16, 16, 33), dtype=np.float32),
+                  'tra_cache': np.zeros((2, 3, 1, 1, 16), dtype=np.float32),
+                  'inter_cache': np.zeros((2, 1, 33, 16), dtype=np.float32)}
+    test_inputs = dict(ref_inputs)
+    for _ in range(steps):
+        mix = rng.standard_normal((1, 257, num_frames, 2), dtype=np.float32)
+        ref_out = ref.run(None, dict(ref_inputs, mix=mix))
+        test_out = test.run(None, dict(test_inputs, mix=mix))
+        deviation = float(np.max(np.abs(ref_out[0] - test_out[0])))
+        if deviation > parity_tolerance:
+            print(f"{test_file} deviates from {ref_file} by {deviation:.2e}")
+            return False
+        ref_inputs = dict(zip(['conv_cache', 'tra_cache', 'inter_cache'], ref_out[1:]))
+        test_inputs = dict(zip(['conv_cache', 'tra_cache', 'inter_cache'], test_out[1:]))
+    return True
+
+
+def publish_if_parity(tmp_file, file, ref_file, num_frames):
+    """move tmp_file to file (a name servers pick up) only if it passes check_parity; otherwise discard it"""
+    if check_parity(ref_file, tmp_file, num_frames):
+        os.replace(tmp_file, file)
+        return True
+    os.remove(tmp_file)
+    return False
+
+
+def export(net, num_frames, file):
+    simple_file = file.split('.onnx')[0] + '_simple.onnx'
+    int8_file = file.split('.onnx')[0] + '_int8.onnx'
+    opt_file = file.split('.onnx')[0] + '_int8_opt.onnx'
+
+    # each stage only reruns when its input is newer than its output
+    if is_stale(source_model, file):
+        conv_cache = torch.zeros(2, 1, 16, 16, 33).to(device)
+        tra_cache = torch.zeros(2, 3, 1, 1, 16).to(device)
+        inter_cache = torch.zeros(2, 1, 33, 16).to(device)
+
+        input = torch.randn(1, 257, num_frames, 2, device=device)
+        torch.onnx.export(net,
+                        (input, conv_cache, tra_cache, inter_cache),
+                        file,
+                        input_names = ['mix', 'conv_cache', 'tra_cache', 'inter_cache'],
+                        output_names = ['enh', 'conv_cache_out', 'tra_cache_out', 'inter_cache_out'],
+                        opset_version=11,
+                        verbose = False)
+
+        onnx.checker.check_model(file)
+
+    # simplify onnx model
+    if is_stale(file, simple_file):
+        model_simp, check = simplify(onnx.load(file))
+        assert check, "Simplified ONNX model could not be validated"
+        onnx.save(model_simp, simple_file)
+
+    # dynamic int8 quantization of MatMul/Gemm weights for CPU inference (VNNI / sdot kernels);
+    # Conv is left in fp32: int8-weight ConvInteger has no CPU kernel in onnxruntime
+    # derived models are written to a temporary name and only published after the parity check,
+    # so a broken file never enters the tiers servers load from
+    if is_stale(simple_file, int8_file):
+        int8_tmp = int8_file.split('.onnx')[0] + '_tmp.onnx'
+        quantize_dynamic(simple_file,
+                         int8_tmp,
+                         weight_type=QuantType.QInt8,
+                         op_types_to_quantize=['MatMul', 'Gemm'])
+        publish_if_parity(int8_tmp, int8_file, simple_file, num_frames)
+
+    if os.path.exists(int8_file) and is_stale(int8_file, opt_file):
+        opt_tmp = opt_file.split('.onnx')[0] + '_tmp.onnx'
+        optimize_offline(int8_file, opt_tmp)
+        publish_if_parity(opt_tmp, opt_file, simple_file, num_frames)
+
+
+if __name__ == '__main__':
+    if is_stale(source_model, source_safetensors):
+        convert_checkpoint(source_model, source_safetensors)
+
+    model = GTCRN().to(device).eval()
+    # model.load_state_dict(torch.load(source_model, map_location=device)['model'])
+    model.load_state_dict(load_file(source_safetensors, device=str(device)))
+    stream_model = StreamGTCRN().to(device).eval()
+    convert_to_stream(stream_model, model)
+    chunk_model = ChunkStreamGTCRN(stream_model, chunk_size).eval()
+
+    export(stream_model, 1, save_model)
+    export(chunk_model, chunk_size, save_chunk_model)
@@ -15,10 +15,12 @@ mix, fs = sf.read(os.path.join('test_wavs', 'mix.wav'), dtype='float32')
 assert fs == 16000
 
 ## inference
-input = torch.stft(torch.from_numpy(mix), 512, 256, 512, torch.hann_window(512).pow(0.5), return_complex=False)
+# the model consumes (B, F, T, 2) real/imag, which view_as_real yields from the complex STFT without a copy
+spec = torch.stft(torch.from_numpy(mix), 512, 256, 512, torch.hann_window(512).pow(0.5), return_complex=True)
+input = torch.view_as_real(spec)
 with torch.no_grad():
     output = model(input[None])[0]
-enh = torch.istft(output, 512, 256, 512, torch.hann_window(512).pow(0.5), return_complex=False)
+enh = torch.istft(torch.view_as_complex(output.contiguous()), 512, 256, 512, torch.hann_window(512).pow(0.5))
 
 ## save enhanced wav
-sf.write(os.path.join('test_wavs', 'enh.wav'), enh.detach().cpu().numpy(), fs)
+sf.write(os.path.join('test_wavs', 'enh.wav'), enh.detach().cpu().numpy(), fs, format='WAV', subtype='PCM_16')
@@ -1,58 +1,59 @@
 import argparse
 import os
+os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 2) // 2)))
+os.environ.setdefault("MKL_NUM_THREADS", os.environ["OMP_NUM_THREADS"])
 import time
-import torch
-import onnxruntime
 import numpy as np
 import soundfile as sf
 from tqdm import tqdm
-from librosa import istft
+from utils.onnx_session import create_session, StreamRunner
+from utils.stft import stft_file, istft
 
-def inference(model_file, source_file, save_file, samplerate):
+def inference(model_file, source_file, save_file, samplerate, chunk_model_file=None, providers=None):
     if model_file.endswith(".onnx"):
-        session = onnxruntime.InferenceSession(model_file, None, providers=['CPUExecutionProvider'])
+        session = create_session(model_file, providers)
     else:        
         print("check your model file is [onnx] type.")
         os._exit(0)
+    chunk_session = None
+    if chunk_model_file:
+        chunk_session = create_session(chunk_model_file, providers)
     
     T_list = []
-    outputs = []
 
-    x = torch.from_numpy(sf.read(source_file, dtype='float32')[0])
-    x = torch.stft(x, 512, 256, 512, torch.hann_window(512).pow(0.5), return_complex=False)[None]
+    with sf.SoundFile(source_file) as f:
+        inputs = stft_file(f)
 
-    conv_cache = np.zeros([2, 1, 16, 16, 33],  dtype="float32")
-    tra_cache = np.zeros([2, 3, 1, 1, 16],  dtype="float32")
-    inter_cache = np.zeros([2, 1, 33, 16],  dtype="float32")
+    runner = StreamRunner(session, chunk_session)
 
-    inputs = x.numpy()
-    for i in tqdm(range(inputs.shape[-2])):
+    outputs = np.empty(inputs.shape, dtype=np.float32)
+    # chunked frames go through the unrolled model, the tail falls back to the per-frame model
+    for i, n in tqdm(runner.steps(inputs.shape[0])):
         tic = time.perf_counter()
         
-        out_i,  conv_cache, tra_cache, inter_cache \
-                = session.run([], {'mix': inputs[..., i:i+1, :],
-                    'conv_cache': conv_cache,
-                    'tra_cache': tra_cache,
-                    'inter_cache': inter_cache})
+        runner.run(inputs[i:i+n], out=outputs[i:i+n])
 
         toc = time.perf_counter()
         T_list.append(toc-tic)
-        outputs.append(out_i)
 
-    outputs = np.concatenate(outputs, axis=2)
-    enhanced = istft(outputs[...,0] + 1j * outputs[...,1], n_fft=512, hop_length=256, win_length=512, window=np.hanning(512)**0.5)
-    sf.write(save_file, enhanced.squeeze(), samplerate)
+    enhanced = istft(outputs)
+    sf.write(save_file, enhanced, samplerate, format='WAV', subtype='PCM_16')
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('-model_file', '--model_file',
                         help='model with .pth type path to load model')
+    parser.add_argument('-chunk_model_file', '--chunk_model_file', default=None,
+                        help='optional chunked onnx model (see export2onnx.py) to batch frames per call')
     parser.add_argument('-source_file', '--source_file',
                         help='path for speech file to enhance')
     parser.add_argument('-save_file', '--save_file',
                         help='path for saving enhanced speech file')
     parser.add_argument('-sr', '--sample_rate', type=int, default=16000,
                         help='sample rate')
+    parser.add_argument('-providers', '--providers', default=None,
+                        help='comma separated onnxruntime execution providers, e.g. CUDAExecutionProvider,CPUExecutionProvider '
+                             '(defaults to $ORT_PROVIDERS, CPU is always the fallback)')
     args = parser.parse_args()
 
-    inference(args.model_file, args.source_file, args.save_file, args.sample_rate)
+    inference(args.model_file, args.source_file, args.save_file, args.sample_rate, args.chunk_model_file, args.providers)
@@ -1,6 +1,6 @@
-model_file="/work/cjh/gtcrn/stream/onnx_models/pytorch_model_simple.onnx"
+model_file="/work/cjh/gtcrn/stream/onnx_models/pytorch_model_int8_opt.onnx"
 source_file="/work/cjh/gtcrn/wav/test1.wav"
-save_file="/work/cjh/gtcrn/test_wavs/test1_pytorch_model_simple_onnx_new.wav"
+save_file="/work/cjh/gtcrn/test_wavs/test1_$(basename ${model_file} .onnx)_onnx_new.wav"
 
 python inference.py --model_file ${model_file} \
                     --source_file ${source_file} \
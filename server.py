@@ -7,42 +7,69 @@
 
 import subprocess
 import os
+# 在导入numpy之前限制OpenMP/MKL线程数，避免与ORT的intra-op线程池争抢CPU
+os.environ.setdefault("OMP_NUM_THREADS", str(max(1, (os.cpu_count() or 2) // 2)))
+os.environ.setdefault("MKL_NUM_THREADS", os.environ["OMP_NUM_THREADS"])
+
 import time
 import socket
 import signal
+import struct
 import sys
 from loguru import logger
 from concurrent.futures import ProcessPoolExecutor
-import torch
+from functools import partial
 import argparse
  
-import torch
-import onnxruntime
 import numpy as np
 import soundfile as sf
 from tqdm import tqdm
-from librosa import istft
 
 # 导入音频预处理模块
-from utils.audio_preprocessing import preprocess_audio_if_needed, cleanup_temp_file as cleanup_audio_temp_file
-
-print('init SeparateSpeech...')
+from utils.audio_preprocessing import load_audio_if_needed
+from utils.onnx_session import find_model_pair, create_session, create_runner_pool, acquire_runner
+from utils.stft import HOP_LENGTH, num_frames, stft, stft_file, istft
+from utils.buffer_pool import BUFFER_POOL
 
 # 依赖安装说明：pip install loguru
-# ONNX模型文件路径
-model_file = "stream/onnx_models/pytorch_model_simple.onnx"
-# 创建ONNX推理会话，使用CPU执行提供者
-session = onnxruntime.InferenceSession(model_file, None, providers=['CPUExecutionProvider'])
 # 获取项目根目录
 basedir = os.path.abspath(os.path.dirname(__file__))
-# 配置日志记录器，记录到logs目录下的denoise.log文件
+# 配置日志记录器，记录到logs目录下的denoise.log文件（enqueue=True，工作进程经fork继承后可安全写入）
 logger.add(os.path.join(os.path.join(basedir, 'logs'), "denoise.log"),
            level="INFO", rotation="50 MB", format="{time}-{level}={message}", encoding="utf-8", enqueue=True)
-print('init SeparateSpeech ok.')
+
+# 推理会话与执行器池只在工作进程中由init_worker创建：ORT会话不可pickle，
+# 在主进程创建后再fork也会让子进程继承失效的线程池
+session = None
+chunk_session = None
+runner_pool = None
 
 
+def init_worker(intra_op_num_threads=None):
+    """
+    工作进程初始化函数：加载模型并创建推理会话与执行器池
 
-def inference(source_file, save_file, samplerate):
+    参数:
+        intra_op_num_threads (int, optional): 每个工作进程的ORT intra-op线程数，未指定时按物理核数
+    """
+    global session, chunk_session, runner_pool
+    print('init SeparateSpeech...')
+    # ONNX模型文件路径（由export2onnx.py导出）：优先使用离线图优化后的INT8动态量化模型，依次回退到INT8、FP32模型；
+    # 分块模型一次推理多帧以摊薄调用开销，与单帧模型取自同一精度档次，没有同档次的分块模型时逐帧推理
+    model_file, chunk_model_file = find_model_pair("stream/onnx_models/pytorch_model", chunk_size=8)
+    if model_file is None:
+        raise FileNotFoundError("模型文件不存在: stream/onnx_models/pytorch_model_int8_opt.onnx、pytorch_model_int8.onnx 或 pytorch_model_simple.onnx")
+    # 创建ONNX推理会话（开启图优化、线程与内存池配置；执行提供者由环境变量ORT_PROVIDERS指定，默认CPU）
+    session = create_session(model_file, intra_op_num_threads=intra_op_num_threads)
+    chunk_session = None
+    if chunk_model_file:
+        chunk_session = create_session(chunk_model_file, intra_op_num_threads=intra_op_num_threads)
+    # 流式推理执行器池（预分配缓存与IOBinding缓冲区），每个工作进程同时只处理一个请求，一个即可
+    runner_pool = create_runner_pool(session, chunk_session, size=1)
+    print('init SeparateSpeech ok.')
+
+
+def inference(source_file, save_file, samplerate, verbose=False):
     """
     音频降噪推理函数
     
@@ -50,87 +77,131 @@ def inference(source_file, save_file, samplerate):
         source_file (str): 输入音频文件路径
         save_file (str): 输出音频文件路径  
         samplerate (int): 采样率
+        verbose (bool): 是否显示逐帧进度条（服务路径默认关闭，避免tqdm的逐帧开销）
     """
-    T_list = []  # 记录每帧处理时间
-    outputs = []  # 存储每帧的输出结果
-    temp_audio_file = None  # 临时音频文件路径
+    T_list = []  # 记录每次推理调用的处理时间
+    buffers = []  # 从缓冲区池借出的工作数组，结束时归还
 
     try:
-        # 音频预处理：转换为16kHz
+        # 音频预处理：需要转换时直接得到16kHz单声道波形（不写临时文件），否则分块读取原文件
         logger.info(f"开始音频预处理: {source_file}")
-        processed_file, is_temp = preprocess_audio_if_needed(source_file, samplerate)
-        if is_temp:
-            temp_audio_file = processed_file
-            logger.info(f"音频已预处理为16kHz: {processed_file}")
+        wav = load_audio_if_needed(source_file, samplerate)
+        if wav is not None:
+            logger.info("音频已转换为16kHz单声道")
+            T = num_frames(len(wav))
+            inputs = BUFFER_POOL.get((T, 257, 2))
+            buffers.append(inputs)
+            stft(wav, out=inputs)
         else:
             logger.info("音频采样率已符合要求，跳过预处理")
+            # 分块读取音频并直接做短时傅里叶变换(STFT)，得到 (T, 257, 2) 频谱，
+            # 不在内存中保留整段波形
+            with sf.SoundFile(source_file) as f:
+                T = num_frames(f.frames)
+                inputs = BUFFER_POOL.get((T, 257, 2))
+                buffers.append(inputs)
+                stft_file(f, out=inputs)
+
+        # 进度条仅在verbose时启用，否则直接迭代
+        progress = tqdm if verbose else (lambda steps, **_: steps)
+        # 预分配输出频谱，推理结果按帧直接写入，省去逐帧列表与最后的拼接拷贝
+        outputs = BUFFER_POOL.get((T, 257, 2))
+        buffers.append(outputs)
+        # 从执行器池取出流式推理执行器（缓存已清零），缓存与输入输出缓冲区跨请求复用
+        with acquire_runner(runner_pool) as runner:
+            # 分块处理：整块的帧每次推理N帧，不足一块的尾帧逐帧处理
+            for i, n in progress(runner.steps(T)):
+                tic = time.perf_counter()
+                
+                # 运行ONNX模型推理，缓存在执行器内部传递，结果写入输出频谱对应帧
+                runner.run(inputs[i:i+n], out=outputs[i:i+n])
+
+                toc = time.perf_counter()
+                T_list.append(toc-tic)  # 记录处理时间
 
-        # 读取预处理后的音频文件并转换为张量
-        x = torch.from_numpy(sf.read(processed_file, dtype='float32')[0])
-        # 对音频进行短时傅里叶变换(STFT)，转换为频域表示
-        x = torch.stft(x, 512, 256, 512, torch.hann_window(512).pow(0.5), return_complex=False)[None]
-
-        # 初始化模型缓存，用于流式处理
-        conv_cache = np.zeros([2, 1, 16, 16, 33],  dtype="float32")  # 卷积层缓存
-        tra_cache = np.zeros([2, 3, 1, 1, 16],  dtype="float32")     # Transformer缓存
-        inter_cache = np.zeros([2, 1, 33, 16],  dtype="float32")     # 中间层缓存
-
-        inputs = x.numpy()
-        # 逐帧处理音频数据
-        for i in tqdm(range(inputs.shape[-2])):
-            tic = time.perf_counter()
-            
-            # 运行ONNX模型推理，输入当前帧和缓存状态
-            out_i, conv_cache, tra_cache, inter_cache \
-                    = session.run([], {'mix': inputs[..., i:i+1, :],
-                        'conv_cache': conv_cache,
-                        'tra_cache': tra_cache,
-                        'inter_cache': inter_cache})
-
-            toc = time.perf_counter()
-            T_list.append(toc-tic)  # 记录处理时间
-            outputs.append(out_i)   # 保存输出结果
-
-        # 将所有帧的输出结果拼接
-        outputs = np.concatenate(outputs, axis=2)
         # 将频域结果转换回时域音频信号
-        enhanced = istft(outputs[...,0] + 1j * outputs[...,1], n_fft=512, hop_length=256, win_length=512, window=np.hanning(512)**0.5)
+        enhanced = BUFFER_POOL.get((HOP_LENGTH * (T - 1),))
+        buffers.append(enhanced)
+        istft(outputs, out=enhanced)
         # 保存降噪后的音频文件
-        sf.write(save_file, enhanced.squeeze(), samplerate)
+        # enhanced已是一维float32，显式指定WAV/PCM_16，由libsndfile直接完成float32->int16转换
+        sf.write(save_file, enhanced, samplerate, format='WAV', subtype='PCM_16')
         
     except Exception as e:
         logger.error(f"音频降噪处理失败: {e}")
         raise
     finally:
-        # 清理临时音频文件
-        if temp_audio_file:
-            cleanup_audio_temp_file(temp_audio_file)
+        # 归还工作数组
+        for buf in buffers:
+            BUFFER_POOL.put(buf)
 
     
-def DenoiseWorker(input_file_path, output_file_path, client_addr, server):
+def DenoiseWorker(input_file_path, output_file_path):
     """
-    降噪工作进程函数（未使用的多进程版本）
-    
+    降噪任务函数，在工作进程中执行
+
     参数:
         input_file_path (str): 输入音频文件路径
         output_file_path (str): 输出音频文件路径
-        client_addr (tuple): 客户端地址
-        server (socket): UDP服务器套接字
+
+    返回:
+        float: 处理耗时（秒）
     """
     # 记录开始时间
     start_time = time.time()
-    # 执行降噪处理（注意：这里缺少samplerate参数）
+    # 执行音频降噪处理
     inference(input_file_path, output_file_path, samplerate=16000)
     # 计算处理耗时
-    cost_time = time.time() - start_time  
-    # 设置返回状态
-    err = 0
-    msg = "success"
+    cost_time = time.time() - start_time
+    # 记录日志
+    logger.info(f"文件[{input_file_path}]降噪完成，花费时间{cost_time}s")
+    return cost_time
+
+
+def reply_when_done(future, server, client_addr, input_file_path):
+    """
+    任务完成回调：向客户端发送处理结果
+
+    参数:
+        future (Future): DenoiseWorker任务
+        server (socket): UDP服务器套接字
+        client_addr (tuple): 客户端地址
+        input_file_path (str): 输入音频文件路径
+    """
+    try:
+        cost_time = future.result()
+    except Exception as e:
+        logger.error(f"文件[{input_file_path}]降噪失败: {e}")
+        err, msg = 1, str(e)
+    else:
+        print(f"文件[{input_file_path}]降噪完成，花费时间{cost_time}s")
+        err, msg = 0, "success"
     # 向客户端发送处理结果（UDP是无状态连接，需要指定目标地址）
     server.sendto(f"{err}|{msg}".encode(), client_addr)
-    # 记录日志
-    logger.info(f"文件[{input_file_path}]降噪完成，花费时间{cost_time}s")    
-    return
+
+
+# UDP请求报文：头部为两个小端u16（输入路径字节数, 输出路径字节数），随后依次是输入、输出路径的原始字节
+REQUEST_HEADER = struct.Struct("<HH")
+# UDP接收缓冲区大小（单个数据报上限）
+RECV_BUFFER_SIZE = 65536
+
+
+def parse_request(view):
+    """
+    解析二进制UDP请求报文
+
+    参数:
+        view (memoryview): 接收到的数据报
+
+    返回:
+        tuple: (输入文件路径, 输出文件路径)，按文件系统编码解码，支持非UTF-8路径
+    """
+    in_len, out_len = REQUEST_HEADER.unpack_from(view)
+    start = REQUEST_HEADER.size
+    end = start + in_len + out_len
+    if end > len(view):
+        raise ValueError(f"请求报文长度不足: 需要{end}字节，实际{len(view)}字节")
+    return os.fsdecode(bytes(view[start:start + in_len])), os.fsdecode(bytes(view[start + in_len:end]))
 
 
 def RecvUDP(server, executor):
@@ -139,52 +210,33 @@ def RecvUDP(server, executor):
     
     参数:
         server (socket): UDP服务器套接字
-        executor (ProcessPoolExecutor): 进程池执行器（当前未使用）
+        executor (ProcessPoolExecutor): 进程池执行器，降噪任务在其工作进程中执行
     """
     print('等待UDP连接...')
+    # 预分配接收缓冲区，每次请求直接接收到其中，不再为数据报分配bytes
+    buffer = bytearray(RECV_BUFFER_SIZE)
+    view = memoryview(buffer)
     while True:
         try:
             # 接收UDP数据包，最大65536字节
-            data, client_addr = server.recvfrom(65536)
-            # 解码接收到的数据
-            data = data.decode("utf8", "ignore")
+            nbytes, client_addr = server.recvfrom_into(buffer)
             print('get UDP...')
+            # 解析客户端发送的文件路径（二进制长度前缀格式，见REQUEST_HEADER）
+            input_file_path, output_file_path = parse_request(view[:nbytes])
         except Exception as e:
-            # 记录接收错误
+            # 记录接收或解析错误
             logger.error(e)
         else:
-            # 解析客户端发送的文件路径（格式：输入文件路径|输出文件路径）
-            input_file_path, output_file_path = data.split("|")
             print(f"输入文件: {input_file_path}")
             print(f"输出文件: {output_file_path}")
-            
-            # 记录开始时间
-            start_time = time.time()
-            # 执行音频降噪处理
-            inference(input_file_path, output_file_path, samplerate=16000)
-            # 计算处理耗时
-            cost_time = time.time() - start_time  
-            
-            # 设置返回状态
-            err = 0
-            msg = "success"
-            # 向客户端发送处理结果（UDP是无状态连接，需要指定目标地址）
-            server.sendto(f"{err}|{msg}".encode(), client_addr)
-            # 记录处理完成的日志
-            logger.info(f"文件[{input_file_path}]降噪完成，花费时间{cost_time}s")    
-            print("文件降噪完成")    
-            print(f"文件[{input_file_path}]降噪完成，花费时间{cost_time}s")    
 
- 
-    
+            # 提交到进程池执行，主循环立即继续接收下一个请求，完成后由回调返回结果
+            future = executor.submit(DenoiseWorker, input_file_path, output_file_path)
+            future.add_done_callback(partial(reply_when_done, server=server, client_addr=client_addr,
+                                             input_file_path=input_file_path))
+
+
 if __name__ == '__main__':
-    # 测试模式：直接处理本地音频文件
-    source_file = "./wav/test1.wav"
-    save_file = "./wav/out.wav"
-    inference(source_file=source_file,
-              save_file=save_file,
-              samplerate=16000)
-    
     def on_exit(signo, frame):
         """
         程序退出处理函数
@@ -205,10 +257,18 @@ if __name__ == '__main__':
     signal.signal(signal.SIGTERM, on_exit)
 
     worker_process = 5
-    with ProcessPoolExecutor(max_workers=worker_process) as executor:
+    # 各工作进程平分物理核，避免ORT线程池相互争抢
+    intra_op_num_threads = max(1, (os.cpu_count() or 2) // 2 // worker_process)
+    with ProcessPoolExecutor(max_workers=worker_process, initializer=init_worker,
+                             initargs=(intra_op_num_threads,)) as executor:
+        # 测试模式：直接处理本地音频文件
+        source_file = "./wav/test1.wav"
+        save_file = "./wav/out.wav"
+        executor.submit(DenoiseWorker, source_file, save_file).result()
+
         port = 7000
         ip_port = ('0.0.0.0', port)
         server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         server.bind(ip_port)
         print('start listening...')
-        RecvUDP(server, executor)              
\ No newline at end of file
+        RecvUDP(server, executor)
@@ -18,9 +18,23 @@ def main():
     parser.add_argument("--reload", action="store_true", help="开发模式（自动重载）")
     parser.add_argument("--workers", type=int, default=1, help="工作进程数 (默认: 1)")
     parser.add_argument("--log-level", default="info", choices=["debug", "info", "warning", "error"], help="日志级别")
+    parser.add_argument("--providers", default=None,
+                        help="ONNX执行提供者，逗号分隔，如 CUDAExecutionProvider,CPUExecutionProvider (默认: 环境变量ORT_PROVIDERS，CPU兜底)")
+    parser.add_argument("--pool-size", type=int, default=None,
+                        help="每个工作进程的执行器池大小，即并发推理上限 (默认: 环境变量API_POOL_SIZE，未设置时为2)")
+    parser.add_argument("--intra-op-threads", type=int, default=None,
+                        help="每个ONNX会话的intra-op线程数 (默认: 环境变量API_INTRA_OP_THREADS，未设置时在执行器间平分物理核)")
     
     args = parser.parse_args()
     
+    # 通过环境变量传递给各工作进程中的init_model()
+    if args.providers:
+        os.environ["ORT_PROVIDERS"] = args.providers
+    if args.pool_size:
+        os.environ["API_POOL_SIZE"] = str(args.pool_size)
+    if args.intra_op_threads:
+        os.environ["API_INTRA_OP_THREADS"] = str(args.intra_op_threads)
+    
     print("=" * 60)
     print("音频降噪FastAPI服务器")
     print("=" * 60)
@@ -350,6 +350,26 @@ class StreamGTCRN(nn.Module):
         return spec_enh, conv_cache, tra_cache, inter_cache
 
 
+class ChunkStreamGTCRN(nn.Module):
+    """Unrolls StreamGTCRN over `chunk_size` frames so one ONNX call processes a chunk."""
+    def __init__(self, stream_model, chunk_size=8):
+        super().__init__()
+        self.stream_model = stream_model
+        self.chunk_size = chunk_size
+
+    def forward(self, spec, conv_cache, tra_cache, inter_cache):
+        """
+        spec: (B, F, T, 2) = (1, 257, chunk_size, 2)
+        caches: same as StreamGTCRN, outputs are the caches after the last frame
+        """
+        outs = []
+        for i in range(self.chunk_size):
+            out_i, conv_cache, tra_cache, inter_cache = self.stream_model(spec[:, :, i:i+1], conv_cache, tra_cache, inter_cache)
+            outs.append(out_i)
+
+        return torch.cat(outs, dim=2), conv_cache, tra_cache, inter_cache
+
+
 if __name__ == "__main__":
     import os
     import time
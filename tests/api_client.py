@@ -6,14 +6,134 @@ FastAPI音频降噪客户端测试程序
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import json
 import time
 import os
 import sys
 import argparse
-from pathlib import Path
+import uuid
 from typing import Optional
 
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，未安装时使用标准库json
+    orjson = None
+
+def create_http_session(pool_size: int = 10) -> requests.Session:
+    """
+    创建带连接池的HTTP会话，keep-alive复用TCP连接，避免每次请求重新握手
+    
+    参数:
+        pool_size (int): 连接池大小
+        
+    返回:
+        requests.Session: HTTP会话
+    """
+    session = requests.Session()
+    session.headers["Accept"] = "application/json"
+    # 连接失败及网关类错误（502/503/504）带退避重试
+    retry = Retry(total=2, backoff_factor=0.2, status_forcelist=(502, 503, 504))
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+# 模块级共享HTTP会话，未显式传入会话时使用
+_SESSION = create_http_session()
+
+def parse_json(response: requests.Response):
+    """
+    解析JSON响应：安装了orjson时直接从响应字节解码，否则使用标准库json
+    
+    参数:
+        response (requests.Response): HTTP响应
+        
+    返回:
+        解析后的JSON对象
+    """
+    if orjson is not None:
+        return orjson.loads(response.content)
+    return json.loads(response.content)
+
+# 请求超时：(连接超时, 读取超时)，读取超时覆盖长音频的处理时间
+REQUEST_TIMEOUT = (5, 300)
+
+# 上传/下载时每次读写的块大小
+CHUNK_SIZE = 64 * 1024
+# 下载时复用的接收缓冲区大小
+DOWNLOAD_BUFFER_SIZE = 1 << 20
+
+def copy_response_to_file(response: requests.Response, f, buffer_size: int = DOWNLOAD_BUFFER_SIZE):
+    """
+    把流式响应体写入文件
+    
+    通过urllib3响应的公开readinto接口读入复用的缓冲区再写入文件，
+    有Content-Encoding时由urllib3先解码
+    
+    参数:
+        response (requests.Response): 以stream=True发出的请求的响应
+        f: 以二进制写模式打开的文件
+        buffer_size (int): 缓冲区大小
+    """
+    response.raw.decode_content = True
+    buffer = bytearray(buffer_size)
+    view = memoryview(buffer)
+    while True:
+        n = response.raw.readinto(buffer)
+        if not n:
+            break
+        f.write(view[:n])
+
+def quote_filename(filename: str) -> str:
+    """
+    转义Content-Disposition头中的文件名：反斜杠与双引号加反斜杠转义，换行符会截断头部，直接拒绝
+    
+    参数:
+        filename (str): 原始文件名
+        
+    返回:
+        str: 可放入双引号内的文件名
+        
+    异常:
+        ValueError: 文件名包含CR/LF时抛出
+    """
+    if '\r' in filename or '\n' in filename:
+        raise ValueError(f"文件名不能包含换行符: {filename!r}")
+    return filename.replace('\\', '\\\\').replace('"', '\\"')
+
+def iter_multipart_upload(file_path: str, fields: dict, boundary: str, chunk_size: int = CHUNK_SIZE):
+    """
+    按块生成multipart/form-data请求体，文件内容边读边发，不整体读入内存
+    
+    参数:
+        file_path (str): 要上传的文件路径（表单字段名为file）
+        fields (dict): 其他表单字段
+        boundary (str): multipart分隔符
+        chunk_size (int): 每次读取的字节数
+        
+    返回:
+        generator: 请求体字节块
+        
+    异常:
+        ValueError: 文件名包含CR/LF时抛出（调用时立即检查，不等到发送请求体）
+    """
+    filename = quote_filename(os.path.basename(file_path))
+    
+    def body():
+        for name, value in fields.items():
+            yield (f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n'
+                   f'{value}\r\n').encode('utf-8')
+        yield (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; '
+               f'filename="{filename}"\r\nContent-Type: audio/wav\r\n\r\n').encode('utf-8')
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                yield chunk
+        yield f'\r\n--{boundary}--\r\n'.encode('utf-8')
+    
+    return body()
+
 class AudioDenoiseAPIClient:
     """音频降噪API客户端"""
     
@@ -25,9 +145,22 @@ class AudioDenoiseAPIClient:
             base_url (str): API服务器基础URL
         """
         self.base_url = base_url.rstrip('/')
-        self.session = requests.Session()
-        # 设置超时时间
-        self.session.timeout = 300  # 5分钟超时
+        self.session = create_http_session()
+    
+    def _request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        发送请求，统一附加超时（requests.Session没有会话级超时，需要每次请求显式传入）
+        
+        参数:
+            method (str): HTTP方法
+            path (str): 接口路径
+            **kwargs: 传给 requests.Session.request 的其他参数
+            
+        返回:
+            requests.Response: HTTP响应
+        """
+        kwargs.setdefault("timeout", REQUEST_TIMEOUT)
+        return self.session.request(method, f"{self.base_url}{path}", **kwargs)
         
     def health_check(self) -> dict:
         """
@@ -37,9 +170,9 @@ class AudioDenoiseAPIClient:
             dict: 健康状态信息
         """
         try:
-            response = self.session.get(f"{self.base_url}/health")
+            response = self._request("GET", "/health")
             response.raise_for_status()
-            return response.json()
+            return parse_json(response)
         except requests.exceptions.RequestException as e:
             return {"error": str(e), "status": "unhealthy"}
     
@@ -51,9 +184,9 @@ class AudioDenoiseAPIClient:
             dict: 模型信息
         """
         try:
-            response = self.session.get(f"{self.base_url}/models/info")
+            response = self._request("GET", "/models/info")
             response.raise_for_status()
-            return response.json()
+            return parse_json(response)
         except requests.exceptions.RequestException as e:
             return {"error": str(e)}
     
@@ -82,13 +215,13 @@ class AudioDenoiseAPIClient:
                 data["output_file"] = output_file
             
             # 发送请求
-            response = self.session.post(
-                f"{self.base_url}/denoise",
+            response = self._request(
+                "POST", "/denoise",
                 json=data,
                 headers={"Content-Type": "application/json"}
             )
             response.raise_for_status()
-            return response.json()
+            return parse_json(response)
             
         except requests.exceptions.RequestException as e:
             return {"error": str(e)}
@@ -108,21 +241,20 @@ class AudioDenoiseAPIClient:
             return {"error": f"文件不存在: {file_path}"}
         
         try:
-            # 准备文件上传
-            with open(file_path, 'rb') as f:
-                files = {'file': (os.path.basename(file_path), f, 'audio/wav')}
-                data = {'samplerate': samplerate}
-                
-                # 发送请求
-                response = self.session.post(
-                    f"{self.base_url}/denoise/upload",
-                    files=files,
-                    data=data
-                )
-                response.raise_for_status()
-                return response.json()
+            # 准备文件上传：请求体由生成器按块产生，requests以chunked方式流式发送
+            boundary = uuid.uuid4().hex
+            body = iter_multipart_upload(file_path, {'samplerate': samplerate}, boundary)
+            
+            # 发送请求
+            response = self._request(
+                "POST", "/denoise/upload",
+                data=body,
+                headers={"Content-Type": f"multipart/form-data; boundary={boundary}"}
+            )
+            response.raise_for_status()
+            return parse_json(response)
                 
-        except requests.exceptions.RequestException as e:
+        except (requests.exceptions.RequestException, ValueError) as e:
             return {"error": str(e)}
     
     def download_file(self, file_id: str, save_path: str) -> bool:
@@ -137,15 +269,15 @@ class AudioDenoiseAPIClient:
             bool: 下载是否成功
         """
         try:
-            response = self.session.get(f"{self.base_url}/download/{file_id}")
-            response.raise_for_status()
-            
-            # 确保保存目录存在
-            os.makedirs(os.path.dirname(save_path), exist_ok=True)
-            
-            # 保存文件
-            with open(save_path, 'wb') as f:
-                f.write(response.content)
+            with self._request("GET", f"/download/{file_id}", stream=True) as response:
+                response.raise_for_status()
+                
+                # 确保保存目录存在
+                os.makedirs(os.path.dirname(save_path), exist_ok=True)
+                
+                # 边接收边写入文件，不把整个响应读入内存
+                with open(save_path, 'wb') as f:
+                    copy_response_to_file(response, f)
             
             return True
             
@@ -153,22 +285,24 @@ class AudioDenoiseAPIClient:
             print(f"下载失败: {e}")
             return False
 
-def test_server_connection(base_url: str) -> bool:
+def test_server_connection(base_url: str, session: Optional[requests.Session] = None) -> bool:
     """
     测试服务器连接
     
     参数:
         base_url (str): 服务器URL
+        session (requests.Session, optional): 复用的HTTP会话，默认使用模块级共享会话
         
     返回:
         bool: 连接是否成功
     """
     print(f"测试服务器连接: {base_url}")
+    session = session or _SESSION
     
     try:
-        response = requests.get(f"{base_url}/", timeout=5)
+        response = session.get(f"{base_url}/", timeout=5)
         response.raise_for_status()
-        data = response.json()
+        data = parse_json(response)
         print(f"服务器响应: {data.get('message', 'Unknown')}")
         return True
     except requests.exceptions.RequestException as e:
@@ -194,8 +328,8 @@ def main():
     # 创建客户端
     client = AudioDenoiseAPIClient(args.url)
     
-    # 测试服务器连接
-    if not test_server_connection(args.url):
+    # 测试服务器连接（复用客户端会话，后续健康检查与模型信息请求沿用已建立的连接）
+    if not test_server_connection(args.url, client.session):
         print("服务器连接测试失败，请检查服务器是否启动")
         return 1
     
@@ -221,8 +355,8 @@ def main():
     
     # 如果没有指定输出文件，自动生成
     if not args.output:
-        input_path = Path(args.input)
-        args.output = str(input_path.parent / f"{input_path.stem}_api_denoised{input_path.suffix}")
+        root, ext = os.path.splitext(args.input)
+        args.output = f"{root}_api_denoised{ext}"
     
     print(f"\n输入文件: {args.input}")
     print(f"输出文件: {args.output}")
@@ -258,16 +392,14 @@ def main():
             print(f"输出文件大小: {result['file_size']} 字节")
         
         # 如果是上传模式，尝试下载文件
-        if args.upload and result.get('success'):
-            output_file = result.get('output_file', '')
-            if output_file and os.path.basename(output_file) in output_file:
-                # 提取文件ID
-                file_id = os.path.basename(output_file)
-                print(f"\n下载处理后的文件...")
-                if client.download_file(file_id, args.output):
-                    print(f"✅ 文件已下载到: {args.output}")
-                else:
-                    print("❌ 文件下载失败")
+        if args.upload and result.get('success') and result.get('output_file'):
+            # 文件ID即服务器端输出文件名
+            file_id = os.path.basename(result['output_file'])
+            print(f"\n下载处理后的文件...")
+            if client.download_file(file_id, args.output):
+                print(f"✅ 文件已下载到: {args.output}")
+            else:
+                print("❌ 文件下载失败")
         
         return 0 if result.get('success') else 1
         
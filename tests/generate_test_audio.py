@@ -8,44 +8,85 @@
 import numpy as np
 import soundfile as sf
 import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
+# 逐块生成与写入时每块的样本数
+BLOCK_SIZE = 16384
+
+def _generate_blocks(N, sample_rate, noise_level, seed):
+    """
+    按块生成未归一化的带噪测试信号，每块为新分配的数组，可直接缓存
+    
+    参数:
+        N (int): 总样本数
+        sample_rate (int): 采样率
+        noise_level (float): 噪声水平
+        seed (np.random.SeedSequence): 噪声随机种子
+        
+    返回:
+        generator: float32信号块
+    """
+    # 时间轴（float32样本序号，乘以 2π/采样率 即得相位）
+    t = np.arange(BLOCK_SIZE, dtype=np.float32)
+    inv_sr = np.float32(1.0 / sample_rate)
+    
+    # 主信号（正弦波 + 谐波）：440Hz 基频、二次谐波、三次谐波
+    freqs = np.array([440.0, 880.0, 1320.0], dtype=np.float32)
+    amps = np.array([1.0, 0.5, 0.3], dtype=np.float32)
+    rng = np.random.default_rng(seed)
+    # 噪声缓冲区在各块间复用
+    noise = np.empty(BLOCK_SIZE, dtype=np.float32)
+    
+    for start in range(0, N, BLOCK_SIZE):
+        n = min(BLOCK_SIZE, N - start)
+        # 一次算出全部分量 (3, n) 再按幅度加权求和，不再逐个分量生成临时数组后累加
+        omega_t = np.float32(2 * np.pi * inv_sr) * (t[:n] + np.float32(start))
+        signal = amps @ np.sin(np.multiply.outer(freqs, omega_t))
+        
+        # 添加噪声：直接生成到预分配缓冲区，原地缩放后叠加到信号上
+        rng.standard_normal(dtype=np.float32, out=noise[:n])
+        noise[:n] *= noise_level
+        np.add(signal, noise[:n], out=signal)
+        yield signal
+
 def generate_test_audio(filename, duration=5.0, sample_rate=16000, noise_level=0.1):
     """
     生成测试音频文件
     
+    信号按块只生成一遍并缓存（测试音频不超过十几秒，全部块仅数百KB），
+    生成时同步求出全局峰值，归一化后逐块写入
+    
     参数:
         filename (str): 输出文件名
         duration (float): 音频时长（秒）
         sample_rate (int): 采样率
         noise_level (float): 噪声水平 (0.0-1.0)
     """
-    # 生成时间轴
-    t = np.linspace(0, duration, int(sample_rate * duration))
-    
-    # 生成主信号（正弦波 + 谐波）
-    signal = np.sin(2 * np.pi * 440 * t)  # 440Hz 基频
-    signal += 0.5 * np.sin(2 * np.pi * 880 * t)  # 二次谐波
-    signal += 0.3 * np.sin(2 * np.pi * 1320 * t)  # 三次谐波
-    
-    # 添加噪声
-    noise = np.random.normal(0, noise_level, len(signal))
-    noisy_signal = signal + noise
+    N = int(sample_rate * duration)
+    seed = np.random.SeedSequence()
     
     # 归一化到 [-1, 1] 范围
-    max_val = np.max(np.abs(noisy_signal))
-    if max_val > 0:
-        noisy_signal = noisy_signal / max_val * 0.8
+    blocks = list(_generate_blocks(N, sample_rate, noise_level, seed))
+    max_val = max((np.max(np.abs(block)) for block in blocks), default=0.0)
+    scale = 0.8 / max_val if max_val > 0 else 1.0
     
     # 确保输出目录存在
     output_dir = Path(filename).parent
     output_dir.mkdir(parents=True, exist_ok=True)
     
-    # 保存音频文件
-    sf.write(filename, noisy_signal, sample_rate)
+    # 逐块保存音频文件
+    with sf.SoundFile(filename, 'w', samplerate=sample_rate, channels=1, subtype='PCM_16') as out:
+        for block in blocks:
+            np.multiply(block, scale, out=block)
+            out.write(block)
     print(f"测试音频已生成: {filename}")
     print(f"时长: {duration}秒, 采样率: {sample_rate}Hz, 噪声水平: {noise_level}")
 
+def _generate_one(job):
+    """进程池任务：job 为 (filename, duration, sample_rate, noise_level)"""
+    generate_test_audio(*job)
+
 def generate_multiple_test_files():
     """生成多个测试音频文件"""
     test_dir = Path("test_audio")
@@ -59,9 +100,11 @@ def generate_multiple_test_files():
         ("high_freq.wav", 3.0, 16000, 0.15),      # 高频信号
     ]
     
-    for filename, duration, sample_rate, noise_level in test_cases:
-        filepath = test_dir / filename
-        generate_test_audio(str(filepath), duration, sample_rate, noise_level)
+    # 各文件互不依赖，在多个进程中并行生成
+    jobs = [(str(test_dir / filename), duration, sample_rate, noise_level)
+            for filename, duration, sample_rate, noise_level in test_cases]
+    with ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, len(jobs))) as executor:
+        list(executor.map(_generate_one, jobs))
     
     print(f"\n所有测试音频文件已生成到: {test_dir.absolute()}")
 
@@ -7,17 +7,29 @@
 
 import subprocess
 import sys
+import threading
+from collections import deque
 import time
 import os
 from pathlib import Path
 
-def run_command(cmd, description=""):
+# 同目录下的客户端模块按脚本所在目录导入，与启动时的工作目录及导入方式无关
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from udp_client import test_server_connection
+from udp_batch_client import send_denoise_batch
+
+# 命令输出最多保留的行数，避免长时间运行的子进程输出无限占用内存
+OUTPUT_MAX_LINES = 1000
+
+def run_command(cmd, description="", timeout=300):
     """
-    运行命令并返回结果
+    运行命令并返回结果，子进程输出逐行实时打印，只保留最近OUTPUT_MAX_LINES行
     
     参数:
         cmd (list): 命令列表
         description (str): 命令描述
+        timeout (int): 超时时间（秒）
         
     返回:
         tuple: (success, output)
@@ -28,32 +40,60 @@ def run_command(cmd, description=""):
     print('='*50)
     
     try:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
             encoding="utf-8",
             errors="ignore",
-            timeout=300,
+            bufsize=1,
         )
-        success = result.returncode == 0
-        
-        if result.stdout:
-            print("输出:")
-            print(result.stdout)
-        
-        if result.stderr:
-            print("错误:")
-            print(result.stderr)
-            
-        return success, (result.stdout or "") + (result.stderr or "")
-        
-    except subprocess.TimeoutExpired:
-        print("命令执行超时")
-        return False, "超时"
     except Exception as e:
         print(f"命令执行失败: {e}")
         return False, str(e)
+    
+    # 超时后终止子进程，读取循环随管道关闭而结束
+    timed_out = threading.Event()
+    def on_timeout():
+        timed_out.set()
+        proc.kill()
+    timer = threading.Timer(timeout, on_timeout)
+    timer.start()
+    
+    output = deque(maxlen=OUTPUT_MAX_LINES)
+    try:
+        print("输出:")
+        for line in proc.stdout:
+            sys.stdout.write(line)
+            output.append(line)
+        proc.wait()
+    finally:
+        timer.cancel()
+        proc.stdout.close()
+    
+    if timed_out.is_set():
+        print("命令执行超时")
+        return False, "超时"
+    
+    return proc.returncode == 0, "".join(output)
+
+def run_denoise_tests():
+    """批量执行互不依赖的降噪测试步骤（步骤3-6），返回 [(测试名称, success), ...]"""
+    tests = [
+        ("短音频降噪", "test_audio/short_clean.wav", "test_audio/short_clean_denoised.wav"),
+        ("中等长度音频降噪", "test_audio/medium_noisy.wav", "test_audio/medium_noisy_denoised.wav"),
+        ("高噪声音频降噪", "test_audio/long_very_noisy.wav", "test_audio/long_very_noisy_denoised.wav"),
+        ("自定义输出路径", "test_audio/high_freq.wav", "test_output/custom_denoised.wav"),
+    ]
+    # 在本进程内一次发出全部请求并统一等待响应，不再为每个用例启动一个客户端进程
+    results = send_denoise_batch([(input_file, output_file) for _, input_file, output_file in tests])
+    
+    test_results = []
+    for (name, input_file, output_file), (success, message, cost_time) in zip(tests, results):
+        print(f"  {name}: {'✅' if success else '❌'} {input_file} -> {output_file} ({message}, {cost_time:.2f}秒)")
+        test_results.append((name, success))
+    return test_results
 
 def check_server_running(host='localhost', port=7000):
     """检查服务器是否运行"""
@@ -106,50 +146,14 @@ def main():
         print("生成测试音频失败，无法继续测试")
         return 1
     
-    # 2. 测试连接
+    # 2. 测试连接（在本进程内进行，不再启动客户端进程）
     print("\n步骤 2: 测试服务器连接")
-    success, output = run_command(
-        [sys.executable, "tests/udp_client.py", "--test-only"],
-        "测试服务器连接"
-    )
+    success = test_server_connection()
     test_results.append(("测试连接", success))
     
-    # 3. 测试短音频
-    print("\n步骤 3: 测试短音频降噪")
-    success, output = run_command(
-        [sys.executable, "tests/udp_client.py", 
-         "--input", "test_audio/short_clean.wav"],
-        "短音频降噪测试"
-    )
-    test_results.append(("短音频降噪", success))
-    
-    # 4. 测试中等长度音频
-    print("\n步骤 4: 测试中等长度音频降噪")
-    success, output = run_command(
-        [sys.executable, "tests/udp_client.py", 
-         "--input", "test_audio/medium_noisy.wav"],
-        "中等长度音频降噪测试"
-    )
-    test_results.append(("中等长度音频降噪", success))
-    
-    # 5. 测试高噪声音频
-    print("\n步骤 5: 测试高噪声音频降噪")
-    success, output = run_command(
-        [sys.executable, "tests/udp_client.py", 
-         "--input", "test_audio/long_very_noisy.wav"],
-        "高噪声音频降噪测试"
-    )
-    test_results.append(("高噪声音频降噪", success))
-    
-    # 6. 测试自定义输出路径
-    print("\n步骤 6: 测试自定义输出路径")
-    success, output = run_command(
-        [sys.executable, "tests/udp_client.py", 
-         "--input", "test_audio/high_freq.wav",
-         "--output", "test_output/custom_denoised.wav"],
-        "自定义输出路径测试"
-    )
-    test_results.append(("自定义输出路径", success))
+    # 3-6. 短音频、中等长度音频、高噪声音频、自定义输出路径，互不依赖，批量发送由服务器并行处理
+    print("\n步骤 3-6: 批量测试短音频、中等长度音频、高噪声音频降噪及自定义输出路径")
+    test_results.extend(run_denoise_tests())
     
     # 输出测试结果汇总
     print("\n" + "="*60)
@@ -5,16 +5,31 @@ FastAPI音频降噪服务测试脚本
 作者：天聪语音智能软件公司
 """
 
+import asyncio
 import subprocess
 import sys
+import threading
+from collections import deque
 import time
 import os
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from pathlib import Path
 
+# 同目录下的客户端模块按脚本所在目录导入，与启动时的工作目录及导入方式无关
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from api_client import create_http_session
+
+# 模块级共享HTTP会话：keep-alive连接池，服务器检查与各端点探测复用同一组TCP连接
+_SESSION = create_http_session()
+
+# 命令输出最多保留的行数，避免长时间运行的子进程输出无限占用内存
+OUTPUT_MAX_LINES = 1000
+
 def run_command(cmd, description="", timeout=300):
     """
-    运行命令并返回结果
+    运行命令并返回结果，子进程输出逐行实时打印，只保留最近OUTPUT_MAX_LINES行
     
     参数:
         cmd (list): 命令列表
@@ -30,39 +45,127 @@ def run_command(cmd, description="", timeout=300):
     print('='*50)
     
     try:
-        result = subprocess.run(
+        proc = subprocess.Popen(
             cmd,
-            capture_output=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
             text=True,
             encoding="utf-8",
             errors="ignore",
-            timeout=timeout,
+            bufsize=1,
         )
-        success = result.returncode == 0
+    except Exception as e:
+        print(f"命令执行失败: {e}")
+        return False, str(e)
+    
+    # 超时后终止子进程，读取循环随管道关闭而结束
+    timed_out = threading.Event()
+    def on_timeout():
+        timed_out.set()
+        proc.kill()
+    timer = threading.Timer(timeout, on_timeout)
+    timer.start()
+    
+    output = deque(maxlen=OUTPUT_MAX_LINES)
+    try:
+        print("输出:")
+        for line in proc.stdout:
+            sys.stdout.write(line)
+            output.append(line)
+        proc.wait()
+    finally:
+        timer.cancel()
+        proc.stdout.close()
+    
+    if timed_out.is_set():
+        print("命令执行超时")
+        return False, "超时"
+    
+    return proc.returncode == 0, "".join(output)
+
+async def run_command_async(cmd, description="", timeout=300):
+    """
+    异步运行命令并返回结果，供互不依赖的测试步骤并发执行；
+    输出在命令结束后整体打印，避免多个命令的输出交错，只保留最近OUTPUT_MAX_LINES行
+    
+    参数:
+        cmd (list): 命令列表
+        description (str): 命令描述
+        timeout (int): 超时时间（秒）
         
-        if result.stdout:
-            print("输出:")
-            print(result.stdout)
+    返回:
+        tuple: (success, output)
+    """
+    output = deque(maxlen=OUTPUT_MAX_LINES)
+    error = None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+        )
         
-        if result.stderr:
-            print("错误:")
-            print(result.stderr)
-            
-        return success, (result.stdout or "") + (result.stderr or "")
+        async def drain():
+            async for line in proc.stdout:
+                output.append(line.decode("utf-8", errors="ignore"))
+            await proc.wait()
         
-    except subprocess.TimeoutExpired:
-        print("命令执行超时")
-        return False, "超时"
+        try:
+            await asyncio.wait_for(drain(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            error = "超时"
     except Exception as e:
-        print(f"命令执行失败: {e}")
-        return False, str(e)
+        error = str(e)
+    
+    print(f"\n{'='*50}")
+    print(f"执行: {description}")
+    print(f"命令: {' '.join(cmd)}")
+    print('='*50)
+    
+    if error is not None:
+        print("命令执行超时" if error == "超时" else f"命令执行失败: {error}")
+        return False, error
+    
+    output = "".join(output)
+    if output:
+        print("输出:")
+        print(output)
+    
+    return proc.returncode == 0, output
 
-def check_api_server(base_url="http://localhost:8000"):
+async def run_client_tests():
+    """并发执行互不依赖的客户端测试步骤（步骤3-7），返回 [(测试名称, success), ...]"""
+    tests = [
+        ("健康检查", "API健康检查测试",
+         ["--test-only"]),
+        ("文件路径模式", "文件路径模式降噪测试",
+         ["--input", "test_audio/short_clean.wav"]),
+        ("上传模式", "上传模式降噪测试",
+         ["--input", "test_audio/medium_noisy.wav", "--upload"]),
+        ("长音频处理", "长音频降噪测试",
+         ["--input", "test_audio/long_very_noisy.wav", "--output", "test_output/long_denoised.wav"]),
+        ("错误处理", "错误处理测试",
+         ["--input", "nonexistent.wav"]),
+    ]
+    results = await asyncio.gather(*[
+        run_command_async([sys.executable, "tests/api_client.py"] + args, description)
+        for _, description, args in tests
+    ])
+    test_results = [(name, success) for (name, _, _), (success, _) in zip(tests, results)]
+    # 对于错误处理测试，我们期望返回非零退出码
+    name, success = test_results[-1]
+    test_results[-1] = (name, not success)
+    return test_results
+
+def check_api_server(base_url="http://localhost:8000", session=None):
     """检查API服务器是否运行"""
     print(f"检查API服务器状态: {base_url}")
+    session = session or _SESSION
     
     try:
-        response = requests.get(f"{base_url}/", timeout=5)
+        response = session.get(f"{base_url}/", timeout=5)
         response.raise_for_status()
         data = response.json()
         print(f"服务器响应: {data.get('message', 'Unknown')}")
@@ -71,9 +174,10 @@ def check_api_server(base_url="http://localhost:8000"):
         print(f"API服务器连接失败: {e}")
         return False
 
-def test_api_endpoints(base_url="http://localhost:8000"):
+def test_api_endpoints(base_url="http://localhost:8000", session=None):
     """测试API端点"""
     print("\n测试API端点...")
+    session = session or _SESSION
     
     endpoints = [
         ("/", "根路径"),
@@ -82,18 +186,23 @@ def test_api_endpoints(base_url="http://localhost:8000"):
         ("/docs", "API文档"),
     ]
     
-    results = []
-    
-    for endpoint, description in endpoints:
+    def probe(endpoint):
+        """请求单个端点，返回 (描述, 是否成功, 结果说明)"""
+        path, description = endpoint
         try:
-            url = f"{base_url}{endpoint}"
-            response = requests.get(url, timeout=10)
-            success = response.status_code == 200
-            print(f"  {description}: {'✅' if success else '❌'} (状态码: {response.status_code})")
-            results.append((description, success))
+            response = session.get(f"{base_url}{path}", timeout=10)
+            return description, response.status_code == 200, f"状态码: {response.status_code}"
         except Exception as e:
-            print(f"  {description}: ❌ (错误: {e})")
-            results.append((description, False))
+            return description, False, f"错误: {e}"
+    
+    # 各端点并发请求，共享会话的连接池；map按输入顺序返回结果，输出顺序与串行时一致
+    with ThreadPoolExecutor(max_workers=len(endpoints)) as executor:
+        probed = list(executor.map(probe, endpoints))
+    
+    results = []
+    for description, success, detail in probed:
+        print(f"  {description}: {'✅' if success else '❌'} ({detail})")
+        results.append((description, success))
     
     return results
 
@@ -140,52 +249,9 @@ def main():
     endpoint_results = test_api_endpoints(base_url)
     test_results.extend(endpoint_results)
     
-    # 3. 测试健康检查
-    print("\n步骤 3: 测试健康检查")
-    success, output = run_command(
-        [sys.executable, "tests/api_client.py", "--test-only"],
-        "API健康检查测试"
-    )
-    test_results.append(("健康检查", success))
-    
-    # 4. 测试文件路径模式
-    print("\n步骤 4: 测试文件路径模式")
-    success, output = run_command(
-        [sys.executable, "tests/api_client.py", 
-         "--input", "test_audio/short_clean.wav"],
-        "文件路径模式降噪测试"
-    )
-    test_results.append(("文件路径模式", success))
-    
-    # 5. 测试上传模式
-    print("\n步骤 5: 测试上传模式")
-    success, output = run_command(
-        [sys.executable, "tests/api_client.py", 
-         "--input", "test_audio/medium_noisy.wav",
-         "--upload"],
-        "上传模式降噪测试"
-    )
-    test_results.append(("上传模式", success))
-    
-    # 6. 测试长音频处理
-    print("\n步骤 6: 测试长音频处理")
-    success, output = run_command(
-        [sys.executable, "tests/api_client.py", 
-         "--input", "test_audio/long_very_noisy.wav",
-         "--output", "test_output/long_denoised.wav"],
-        "长音频降噪测试"
-    )
-    test_results.append(("长音频处理", success))
-    
-    # 7. 测试错误处理
-    print("\n步骤 7: 测试错误处理")
-    success, output = run_command(
-        [sys.executable, "tests/api_client.py", 
-         "--input", "nonexistent.wav"],
-        "错误处理测试"
-    )
-    # 对于错误处理测试，我们期望返回非零退出码
-    test_results.append(("错误处理", not success))
+    # 3-7. 健康检查、文件路径模式、上传模式、长音频处理、错误处理，互不依赖，并发执行
+    print("\n步骤 3-7: 并发测试健康检查、文件路径模式、上传模式、长音频处理及错误处理")
+    test_results.extend(asyncio.run(run_client_tests()))
     
     # 输出测试结果汇总
     print("\n" + "="*60)
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+"""
+模型导出测试
+功能：验证GTCRN权重可以无损地转换为safetensors并重新加载（python -m pytest tests/test_export2onnx.py）
+作者：天聪语音智能软件公司
+"""
+
+import sys
+from pathlib import Path
+
+import torch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from gtcrn import GTCRN
+from export2onnx import convert_checkpoint
+from safetensors.torch import load_file
+
+
+def test_safetensors_roundtrip(tmp_path):
+    """GTCRN的state dict含共享存储的转置视图（ERB.ierb_fc.weight），转换后应能完整加载"""
+    state_dict = GTCRN().eval().state_dict()
+    checkpoint = tmp_path / "pytorch_model.bin"
+    converted = tmp_path / "pytorch_model.safetensors"
+    torch.save(state_dict, checkpoint)
+
+    convert_checkpoint(str(checkpoint), str(converted))
+    loaded = load_file(str(converted))
+
+    assert loaded.keys() == state_dict.keys()
+    for k, v in state_dict.items():
+        assert torch.equal(loaded[k], v), k
+
+    model = GTCRN().eval()
+    model.load_state_dict(loaded)
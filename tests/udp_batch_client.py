@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+UDP音频降噪批量客户端
+功能：一次性发出多个降噪请求并统一等待全部响应，服务器并行处理各请求
+作者：天聪语音智能软件公司
+"""
+
+import socket
+import selectors
+import time
+import os
+import sys
+import argparse
+
+from udp_client import pack_request, parse_response, default_output_path
+
+def send_denoise_batch(cases, host='localhost', port=7000, timeout=30.0):
+    """
+    批量发送降噪请求
+
+    每个请求使用独立的UDP套接字（响应不带请求标识，以套接字区分），
+    先全部发送，再用selectors在同一个等待循环中接收所有响应
+
+    参数:
+        cases (list): [(input_file, output_file), ...]
+        host (str): 服务器地址
+        port (int): 服务器端口
+        timeout (float): 单个请求的超时时间（秒），整批等待时间按已发出的请求数放大，
+                         服务器工作进程不足而排队处理时也不会误判超时
+
+    返回:
+        list: [(success, message, cost_time), ...]，顺序与cases一致
+    """
+    results = [None] * len(cases)
+    selector = selectors.DefaultSelector()
+    start_time = time.time()
+
+    try:
+        for i, (input_file, output_file) in enumerate(cases):
+            if not os.path.exists(input_file):
+                results[i] = (False, f"输入文件不存在: {input_file}", 0)
+                continue
+
+            # 确保输出目录存在
+            output_dir = os.path.dirname(output_file)
+            if output_dir:
+                os.makedirs(output_dir, exist_ok=True)
+
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.setblocking(False)
+            try:
+                sock.sendto(pack_request(input_file, output_file), (host, port))
+            except OSError as e:
+                sock.close()
+                results[i] = (False, f"请求失败: {e}", time.time() - start_time)
+                continue
+            selector.register(sock, selectors.EVENT_READ, i)
+
+        # 统一等待所有响应；最坏情况下服务器逐个处理，等待上限为单请求超时乘以请求数
+        deadline = start_time + timeout * len(selector.get_map())
+        while selector.get_map():
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                i = key.data
+                try:
+                    response = key.fileobj.recv(1024)
+                except OSError as e:
+                    results[i] = (False, f"请求失败: {e}", time.time() - start_time)
+                else:
+                    success, msg = parse_response(response)
+                    results[i] = (success, msg, time.time() - start_time)
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+
+        # 超时未响应的请求
+        for key in list(selector.get_map().values()):
+            results[key.data] = (False, "请求超时，服务器可能未响应", time.time() - start_time)
+            selector.unregister(key.fileobj)
+            key.fileobj.close()
+    finally:
+        selector.close()
+
+    return results
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description='音频降噪UDP批量客户端')
+    parser.add_argument('--host', default='localhost', help='服务器地址 (默认: localhost)')
+    parser.add_argument('--port', type=int, default=7000, help='服务器端口 (默认: 7000)')
+    parser.add_argument('--input', nargs='+', required=True, help='输入音频文件路径（可多个）')
+    parser.add_argument('--timeout', type=float, default=30.0, help='单个请求超时时间（秒），整批等待上限按请求数放大')
+
+    args = parser.parse_args()
+
+    # 输出文件名：输入文件名_denoised
+    cases = [(input_file, default_output_path(input_file)) for input_file in args.input]
+
+    results = send_denoise_batch(cases, args.host, args.port, args.timeout)
+
+    for (input_file, output_file), (success, message, cost_time) in zip(cases, results):
+        print(f"{'成功' if success else '失败'}: {input_file} -> {output_file} ({message}, {cost_time:.2f}秒)")
+
+    return 0 if all(success for success, _, _ in results) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,11 +6,48 @@ UDP音频降噪客户端测试程序
 """
 
 import socket
+import struct
 import time
 import os
 import sys
 import argparse
-from pathlib import Path
+
+# 请求报文头部：两个小端u16（输入路径字节数, 输出路径字节数），与服务器端server.REQUEST_HEADER一致
+REQUEST_HEADER = struct.Struct("<HH")
+
+
+def pack_request(input_file, output_file):
+    """
+    构造二进制降噪请求报文
+
+    参数:
+        input_file (str): 输入音频文件路径
+        output_file (str): 输出音频文件路径
+
+    返回:
+        bytes: 头部 + 输入路径字节 + 输出路径字节
+    """
+    inp = os.fsencode(input_file)
+    out = os.fsencode(output_file)
+    return REQUEST_HEADER.pack(len(inp), len(out)) + inp + out
+
+
+def parse_response(response):
+    """
+    解析服务器响应
+    
+    参数:
+        response (bytes): 服务器响应，格式为 错误码|消息
+        
+    返回:
+        tuple: (success, message)
+    """
+    # 错误码为ASCII数字，直接在字节上切分，只对消息部分做UTF-8解码
+    idx = response.find(b'|')
+    if idx < 0:
+        return False, f"服务器响应格式错误: {response!r}"
+    return response[:idx] == b'0', response[idx + 1:].decode('utf-8', 'replace')
+
 
 class AudioDenoiseClient:
     """音频降噪UDP客户端"""
@@ -59,12 +96,12 @@ class AudioDenoiseClient:
             
         # 确保输出目录存在
         output_dir = os.path.dirname(output_file)
-        if output_dir and not os.path.exists(output_dir):
+        if output_dir:
             os.makedirs(output_dir, exist_ok=True)
         
         try:
-            # 构造请求消息：输入文件路径|输出文件路径
-            message = f"{input_file}|{output_file}"
+            # 构造请求报文：长度前缀 + 输入文件路径 + 输出文件路径
+            message = pack_request(input_file, output_file)
             
             print(f"发送降噪请求...")
             print(f"输入文件: {input_file}")
@@ -74,22 +111,17 @@ class AudioDenoiseClient:
             start_time = time.time()
             
             # 发送请求到服务器
-            self.client_socket.sendto(message.encode('utf-8'), (self.server_host, self.server_port))
+            self.client_socket.sendto(message, (self.server_host, self.server_port))
             
             # 等待服务器响应
             response, server_addr = self.client_socket.recvfrom(1024)
-            response_str = response.decode('utf-8')
             
             # 计算总耗时
             cost_time = time.time() - start_time
             
             # 解析响应：错误码|消息
-            if '|' in response_str:
-                err_code, msg = response_str.split('|', 1)
-                success = (err_code == '0')
-                return success, msg, cost_time
-            else:
-                return False, f"服务器响应格式错误: {response_str}", cost_time
+            success, msg = parse_response(response)
+            return success, msg, cost_time
                 
         except socket.timeout:
             return False, "请求超时，服务器可能未响应", time.time() - start_time
@@ -103,6 +135,9 @@ class AudioDenoiseClient:
             self.client_socket = None
             print("客户端连接已关闭")
 
+# 连接探测等待响应的时间（秒）
+PROBE_TIMEOUT = 0.2
+
 def test_server_connection(host='localhost', port=7000):
     """
     测试服务器连接
@@ -117,13 +152,12 @@ def test_server_connection(host='localhost', port=7000):
     print(f"测试服务器连接: {host}:{port}")
     
     try:
-        # 创建测试套接字
+        # 创建测试套接字（服务器不会回复探测消息，只短暂等待）
         test_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        test_socket.settimeout(5.0)
+        test_socket.settimeout(PROBE_TIMEOUT)
         
-        # 发送测试消息
-        test_message = "test|test"
-        test_socket.sendto(test_message.encode('utf-8'), (host, port))
+        # 发送测试消息：长度前缀不合法，服务器只记录解析错误，不会触发降噪
+        test_socket.sendto(b"ping", (host, port))
         
         # 尝试接收响应（可能会超时，这是正常的）
         try:
@@ -139,6 +173,58 @@ def test_server_connection(host='localhost', port=7000):
         print(f"服务器连接失败: {e}")
         return False
 
+def _safe_size(path):
+    """返回文件大小（字节），文件不存在或无法访问时返回None；只做一次stat"""
+    try:
+        return os.stat(path).st_size
+    except OSError:
+        return None
+
+def default_output_path(input_file, tag="_denoised"):
+    """
+    默认输出文件路径：与输入文件同目录，文件名加后缀标记
+    
+    参数:
+        input_file (str): 输入音频文件路径
+        tag (str): 文件名后缀标记
+        
+    返回:
+        str: 输出文件路径，如 test_audio/a.wav -> test_audio/a_denoised.wav
+    """
+    root, ext = os.path.splitext(input_file)
+    return f"{root}{tag}{ext}"
+
+def run_case(client, input_file, output_file):
+    """
+    使用已连接的客户端执行一个降噪用例并打印结果，多个用例可复用同一个客户端及其套接字
+    
+    参数:
+        client (AudioDenoiseClient): 已连接的客户端
+        input_file (str): 输入音频文件路径
+        output_file (str): 输出音频文件路径
+        
+    返回:
+        tuple: (success, message, cost_time)
+    """
+    success, message, cost_time = client.send_denoise_request(input_file, output_file)
+    
+    print("\n" + "=" * 30)
+    print("处理结果:")
+    print("=" * 30)
+    print(f"状态: {'成功' if success else '失败'}")
+    print(f"消息: {message}")
+    print(f"耗时: {cost_time:.2f}秒")
+    
+    if success:
+        print(f"降噪完成！输出文件: {output_file}")
+        file_size = _safe_size(output_file)
+        if file_size is not None:
+            print(f"输出文件大小: {file_size} 字节")
+    else:
+        print("降噪失败，请检查错误信息")
+    
+    return success, message, cost_time
+
 def main():
     """主函数"""
     parser = argparse.ArgumentParser(description='音频降噪UDP客户端测试程序')
@@ -147,20 +233,20 @@ def main():
     parser.add_argument('--input', required=True, help='输入音频文件路径')
     parser.add_argument('--output', help='输出音频文件路径 (默认: 输入文件名_denoised.wav)')
     parser.add_argument('--test-only', action='store_true', help='仅测试连接，不发送实际请求')
+    parser.add_argument('--skip-probe', action='store_true', help='跳过连接测试（调用方已测试过连接时使用）')
     
     args = parser.parse_args()
     
     # 如果没有指定输出文件，自动生成
     if not args.output:
-        input_path = Path(args.input)
-        args.output = str(input_path.parent / f"{input_path.stem}_denoised{input_path.suffix}")
+        args.output = default_output_path(args.input)
     
     print("=" * 50)
     print("音频降噪UDP客户端测试程序")
     print("=" * 50)
     
     # 测试服务器连接
-    if not test_server_connection(args.host, args.port):
+    if not args.skip_probe and not test_server_connection(args.host, args.port):
         print("服务器连接测试失败，请检查服务器是否启动")
         return 1
     
@@ -176,22 +262,7 @@ def main():
             return 1
         
         # 发送降噪请求
-        success, message, cost_time = client.send_denoise_request(args.input, args.output)
-        
-        print("\n" + "=" * 30)
-        print("处理结果:")
-        print("=" * 30)
-        print(f"状态: {'成功' if success else '失败'}")
-        print(f"消息: {message}")
-        print(f"耗时: {cost_time:.2f}秒")
-        
-        if success:
-            print(f"降噪完成！输出文件: {args.output}")
-            if os.path.exists(args.output):
-                file_size = os.path.getsize(args.output)
-                print(f"输出文件大小: {file_size} 字节")
-        else:
-            print("降噪失败，请检查错误信息")
+        success, _, _ = run_case(client, args.input, args.output)
             
     finally:
         client.close()
@@ -1,15 +1,229 @@
 # -*- coding: utf-8 -*-
 """
 音频预处理模块
-功能：使用ffmpeg将音频转换为16kHz采样率
+功能：将音频转换为16kHz单声道（libsndfile可解码的格式在进程内重采样，其余格式使用ffmpeg）
 作者：天聪语音智能软件公司
 """
 
 import os
+import atexit
+import hashlib
+import json
+import shutil
 import tempfile
 import subprocess
+import time
+from functools import lru_cache
 from pathlib import Path
 from loguru import logger
+import numpy as np
+import soundfile as sf
+from scipy.signal import resample_poly
+from numba import njit
+
+try:
+    import soxr
+except ImportError:  # soxr为可选依赖，未安装时非整数倍比例使用numba内核重采样
+    soxr = None
+
+try:
+    import orjson
+except ImportError:  # orjson为可选依赖，未安装时使用标准库json
+    orjson = None
+
+# 解析ffprobe输出的bytes（标准库json.loads同样接受bytes）
+_json_loads = orjson.loads if orjson is not None else json.loads
+
+# 可由soundfile直接读取文件头获取采样率等信息的扩展名
+HEADER_READABLE_EXTENSIONS = ('.wav', '.flac', '.ogg', '.aiff')
+
+# 临时文件目录：Linux上优先使用内存文件系统/dev/shm，转换结果不落盘；剩余空间不足时改用常规临时目录，
+# 不可用时放在输入文件所在目录
+TEMP_DIR = '/dev/shm' if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK) else None
+
+
+# 已创建、尚未清理的临时文件，进程退出时统一删除（见 mark_temp_file）
+_temp_files = set()
+
+
+# 转换结果的持久缓存目录（preprocess_audio_if_needed(use_cache=True)时使用），可由环境变量GTCRN_AUDIO_CACHE_DIR指定
+CACHE_DIR = Path(os.environ.get('GTCRN_AUDIO_CACHE_DIR', Path.home() / '.cache' / 'gtcrn_audio'))
+
+
+def _cache_path_for(input_file: str, target_sample_rate: int) -> Path:
+    """
+    输入文件对应的缓存路径，以 (路径, 大小, 修改时间, 目标采样率) 为键，文件被修改后自动失效
+
+    参数:
+        input_file (str): 输入音频文件路径
+        target_sample_rate (int): 目标采样率
+
+    返回:
+        Path: 缓存文件路径
+    """
+    st = os.stat(input_file)
+    path_hash = hashlib.md5(os.path.abspath(input_file).encode('utf-8')).hexdigest()[:16]
+    return CACHE_DIR / f"{path_hash}_{st.st_size}_{st.st_mtime_ns}_{target_sample_rate}.wav"
+
+
+# /dev/shm上为并发请求保留的余量；容器默认的/dev/shm只有64MB
+TEMP_DIR_HEADROOM = 16 << 20
+
+
+def _expected_output_size(input_file: str, audio_info: dict = None, target_sample_rate: int = 16000) -> int:
+    """
+    估算转换后16位单声道WAV的字节数，用于判断/dev/shm空间是否足够
+
+    参数:
+        input_file (str): 输入音频文件路径
+        audio_info (dict, optional): get_audio_info 的返回值
+        target_sample_rate (int): 目标采样率
+
+    返回:
+        int: 估算的输出文件大小；时长未知时按输入文件大小的8倍保守估计
+    """
+    duration = (audio_info or {}).get('duration', 0)
+    if duration:
+        return int(duration * target_sample_rate * 2) + 44
+    return os.path.getsize(input_file) * 8
+
+
+def _temp_path_for(input_file: str, expected_size: int = None) -> str:
+    """
+    为输入文件生成唯一的临时输出路径（文件名含temp_16k_，由cleanup_temp_file识别）
+
+    参数:
+        input_file (str): 输入音频文件路径
+        expected_size (int, optional): 需要写入的字节数，/dev/shm剩余空间不足时改用常规临时目录；
+            未指定时由 _expected_output_size 按输入文件估算
+
+    返回:
+        str: 临时WAV文件路径
+    """
+    temp_dir = TEMP_DIR
+    if temp_dir is not None:
+        if expected_size is None:
+            expected_size = _expected_output_size(input_file)
+        if shutil.disk_usage(temp_dir).free < expected_size + TEMP_DIR_HEADROOM:
+            temp_dir = tempfile.gettempdir()
+    temp_dir = temp_dir or os.path.dirname(os.path.abspath(input_file))
+    fd, temp_file = tempfile.mkstemp(prefix=f"temp_16k_{Path(input_file).stem}_", suffix='.wav', dir=temp_dir)
+    os.close(fd)
+    # 登记后即使调用方异常退出未清理，也会在进程退出时删除
+    mark_temp_file(temp_file)
+    return temp_file
+
+
+# ffmpeg重采样滤镜：swr多相滤波器长度16（默认32），乘法次数约为默认的1/4，对16kHz单声道语音听感无差别
+RESAMPLE_FILTER = 'aresample=resampler=swr:filter_size=16:phase_shift=6'
+
+
+# 本模块启动ffmpeg/ffprobe时均传入close_fds=False（Python创建的文件描述符默认不可继承，不会泄漏给子进程），
+# 配合_executable返回的绝对路径，CPython使用posix_spawn(vfork)启动子进程，
+# 而不是fork整个已加载模型的服务进程再exec
+
+
+@lru_cache(maxsize=None)
+def _executable(name: str) -> str:
+    """解析可执行文件的绝对路径并缓存，找不到时原样返回名称"""
+    return shutil.which(name) or name
+
+
+# 窗函数sinc插值核单侧的过零点数，越大过渡带越窄、计算量越大
+SINC_ZERO_CROSSINGS = 16
+
+
+# 不开启parallel：预处理在请求线程/线程池中并发调用，numba的workqueue线程层不支持并发调用
+@njit(fastmath=True, cache=True)
+def _downmix_resample(x, in_sr, out_sr, out):
+    """
+    声道混合与重采样融合为一次遍历：x为 (n, channels) 多声道信号，
+    按汉宁窗加权的sinc插值计算out的每个输出样本，读入各声道样本时就地求平均
+    """
+    n, channels = x.shape
+    ratio = in_sr / out_sr
+    # 降采样时截止频率降到输出奈奎斯特频率，抗混叠
+    cutoff = min(1.0, out_sr / in_sr)
+    half_width = int(np.ceil(SINC_ZERO_CROSSINGS / cutoff))
+    for i in range(out.shape[0]):
+        t = i * ratio
+        center = int(np.floor(t))
+        acc = 0.0
+        for j in range(max(0, center - half_width + 1), min(n, center + half_width + 1)):
+            d = t - j
+            v = 0.0
+            for c in range(channels):
+                v += x[j, c]
+            phase = np.pi * d * cutoff
+            sinc = 1.0 if phase == 0.0 else np.sin(phase) / phase
+            window = 0.5 + 0.5 * np.cos(np.pi * d / half_width)
+            acc += v * sinc * window
+        out[i] = acc * cutoff / channels
+
+
+def resample_inproc(data: np.ndarray, in_sr: int, out_sr: int):
+    """
+    多声道信号混合为单声道并重采样（numba内核，单次遍历），仅在未安装soxr时用于44.1k->16k等非整数倍比例
+
+    参数:
+        data (np.ndarray): 形状 (n, channels) 的float32信号
+        in_sr (int): 输入采样率
+        out_sr (int): 输出采样率
+
+    返回:
+        np.ndarray: 单声道float32波形
+    """
+    out = np.empty(data.shape[0] * out_sr // in_sr, dtype=np.float32)
+    _downmix_resample(data, in_sr, out_sr, out)
+    return out
+
+
+def _read_resampled(input_file: str, target_sample_rate: int = 16000):
+    """
+    在进程内读取音频、混合为单声道并重采样，省去启动ffmpeg进程的开销
+
+    采样率为目标采样率整数倍时（如48k/32k->16k）用多相FIR滤波器 resample_poly 整数倍降采样，
+    其余比例（如44.1k->16k）使用soxr；未安装soxr时退回numba内核 resample_inproc（速度与抗混叠均不及soxr）
+
+    参数:
+        input_file (str): 输入音频文件路径
+        target_sample_rate (int): 目标采样率
+
+    返回:
+        np.ndarray: 单声道float32波形；libsndfile无法解码该格式（如mp3/aac/opus）时返回None
+    """
+    try:
+        data, sample_rate = sf.read(input_file, dtype='float32', always_2d=True)
+    except RuntimeError:
+        return None
+    integer_ratio = sample_rate % target_sample_rate == 0
+    if not integer_ratio and soxr is None:
+        return resample_inproc(data, sample_rate, target_sample_rate)
+    mono = data.mean(axis=1) if data.shape[1] > 1 else data[:, 0]
+    if sample_rate == target_sample_rate:
+        return mono
+    if integer_ratio:
+        return resample_poly(mono, 1, sample_rate // target_sample_rate).astype(np.float32, copy=False)
+    return soxr.resample(mono, sample_rate, target_sample_rate, quality='HQ')
+
+
+def _resample_in_process(input_file: str, output_file: str, target_sample_rate: int = 16000) -> bool:
+    """
+    在进程内重采样并写出16位PCM文件，见 _read_resampled
+
+    参数:
+        input_file (str): 输入音频文件路径
+        output_file (str): 输出音频文件路径
+        target_sample_rate (int): 目标采样率
+
+    返回:
+        bool: 是否转换成功
+    """
+    mono = _read_resampled(input_file, target_sample_rate)
+    if mono is None:
+        return False
+    sf.write(output_file, mono, target_sample_rate, subtype='PCM_16')
+    return True
 
 
 def convert_audio_to_16k(input_file: str, output_file: str = None) -> str:
@@ -27,50 +241,51 @@ def convert_audio_to_16k(input_file: str, output_file: str = None) -> str:
         RuntimeError: ffmpeg转换失败时抛出
     """
     try:
-        # 检查输入文件是否存在
-        if not os.path.exists(input_file):
-            raise FileNotFoundError(f"输入文件不存在: {input_file}")
-        
-        # 如果没有指定输出文件，创建临时文件
+        # 输入文件不存在时由soundfile/ffmpeg报错，不再单独检查
+        # 如果没有指定输出文件，创建临时文件（临时目录必然存在）
         if output_file is None:
-            input_path = Path(input_file)
-            temp_dir = os.path.dirname(input_file)
-            output_file = os.path.join(temp_dir, f"temp_16k_{input_path.stem}.wav")
+            output_file = _temp_path_for(input_file)
+        else:
+            # 确保输出目录存在（已存在时跳过makedirs）
+            output_dir = os.path.dirname(output_file)
+            if output_dir and not os.path.isdir(output_dir):
+                os.makedirs(output_dir, exist_ok=True)
         
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_file)
-        if output_dir:
-            os.makedirs(output_dir, exist_ok=True)
+        # libsndfile可解码的格式直接在进程内重采样
+        if _resample_in_process(input_file, output_file):
+            logger.debug("音频转换完成(进程内重采样): {} -> {}", input_file, output_file)
+            return output_file
         
         # 构建ffmpeg命令
+        # -threads 1: 单线程，并行发生在文件之间（多个并发请求），避免短音频上的线程启动与过量订阅
         # -i: 输入文件
         # -ar 16000: 设置采样率为16kHz
         # -ac 1: 设置为单声道（如果需要）
+        # -af: 使用较短的重采样滤波器，见RESAMPLE_FILTER
         # -y: 覆盖输出文件
         cmd = [
-            'ffmpeg',
+            _executable('ffmpeg'),
+            '-threads', '1',
             '-i', input_file,
             '-ar', '16000',
             '-ac', '1',  # 单声道
+            '-af', RESAMPLE_FILTER,
             '-y',  # 覆盖输出文件
             output_file
         ]
         
-        logger.info(f"开始转换音频: {input_file} -> {output_file}")
+        logger.debug("开始转换音频: {} -> {}", input_file, output_file)
         
-        # 执行ffmpeg命令
-        result = subprocess.run(
+        # 执行ffmpeg命令（check=True，非零退出码时抛出CalledProcessError，正常返回即已写出输出文件）
+        subprocess.run(
             cmd,
             capture_output=True,
             text=True,
-            check=True
+            check=True,
+            close_fds=False
         )
         
-        # 检查输出文件是否成功创建
-        if not os.path.exists(output_file):
-            raise RuntimeError(f"ffmpeg转换失败，输出文件未创建: {output_file}")
-        
-        logger.info(f"音频转换完成: {output_file}")
+        logger.debug("音频转换完成: {}", output_file)
         return output_file
         
     except subprocess.CalledProcessError as e:
@@ -83,19 +298,66 @@ def convert_audio_to_16k(input_file: str, output_file: str = None) -> str:
         raise RuntimeError(error_msg)
 
 
+def convert_audio_to_16k_stream(input_file: str, target_sample_rate: int = 16000) -> np.ndarray:
+    """
+    将音频转换为16kHz单声道并直接返回波形，不写临时文件
+
+    libsndfile可解码的格式在进程内重采样，其余格式由ffmpeg输出float32原始PCM到标准输出，
+    调用方可直接对返回的数组做STFT，省去临时WAV的写入、读回与清理
+
+    参数:
+        input_file (str): 输入音频文件路径
+        target_sample_rate (int): 目标采样率，默认16000
+
+    返回:
+        np.ndarray: 单声道float32波形
+
+    异常:
+        RuntimeError: ffmpeg转换失败时抛出
+    """
+    mono = _read_resampled(input_file, target_sample_rate)
+    if mono is not None:
+        return mono
+
+    # -f f32le -: 以小端float32原始PCM写到标准输出
+    cmd = [
+        _executable('ffmpeg'),
+        '-threads', '1',
+        '-i', input_file,
+        '-ar', str(target_sample_rate),
+        '-ac', '1',
+        '-af', RESAMPLE_FILTER,
+        '-f', 'f32le',
+        '-'
+    ]
+    try:
+        result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, close_fds=False)
+    except subprocess.CalledProcessError as e:
+        error_msg = f"ffmpeg转换失败: {e.stderr.decode(errors='replace')}"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg)
+    except OSError as e:
+        error_msg = f"音频预处理失败: {str(e)}"
+        logger.error(error_msg)
+        raise RuntimeError(error_msg)
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+
+@lru_cache(maxsize=1)
 def check_ffmpeg_available() -> bool:
     """
-    检查ffmpeg是否可用
+    检查ffmpeg是否可用，结果在进程生命周期内缓存，只在首次调用时启动ffmpeg
     
     返回:
         bool: ffmpeg是否可用
     """
     try:
         result = subprocess.run(
-            ['ffmpeg', '-version'],
+            [_executable('ffmpeg'), '-version'],
             capture_output=True,
             text=True,
-            check=True
+            check=True,
+            close_fds=False
         )
         return True
     except (subprocess.CalledProcessError, FileNotFoundError):
@@ -106,38 +368,47 @@ def get_audio_info(input_file: str) -> dict:
     """
     获取音频文件信息
     
+    WAV/FLAC/OGG/AIFF直接用soundfile读取文件头，其余格式（mp3/aac/opus及容器格式）调用ffprobe
+    
     参数:
         input_file (str): 音频文件路径
         
     返回:
         dict: 音频信息，包含采样率、声道数、时长等
     """
+    if input_file.lower().endswith(HEADER_READABLE_EXTENSIONS):
+        try:
+            info = sf.info(input_file)
+            return {
+                'sample_rate': info.samplerate,
+                'channels': info.channels,
+                'duration': info.duration,
+                'codec': info.subtype.lower()
+            }
+        except RuntimeError:
+            pass  # 文件头无法解析时交给ffprobe
+
     try:
+        # 只选择第一条音频流、只输出需要的字段，输出与解析量均大幅减少
         cmd = [
-            'ffprobe',
+            _executable('ffprobe'),
             '-v', 'quiet',
-            '-print_format', 'json',
-            '-show_format',
-            '-show_streams',
+            '-select_streams', 'a:0',
+            '-show_entries', 'stream=sample_rate,channels,duration,codec_name',
+            '-of', 'json',
             input_file
         ]
         
+        # 不指定text=True，输出保持bytes，直接交给JSON解析，省去一次UTF-8解码
         result = subprocess.run(
             cmd,
             capture_output=True,
-            text=True,
-            check=True
+            check=True,
+            close_fds=False
         )
         
-        import json
-        info = json.loads(result.stdout)
-        
-        # 提取音频流信息
-        audio_stream = None
-        for stream in info.get('streams', []):
-            if stream.get('codec_type') == 'audio':
-                audio_stream = stream
-                break
+        streams = _json_loads(result.stdout).get('streams', [])
+        audio_stream = streams[0] if streams else None
         
         if audio_stream:
             return {
@@ -154,41 +425,74 @@ def get_audio_info(input_file: str) -> dict:
         return {}
 
 
-def preprocess_audio_if_needed(input_file: str, target_sample_rate: int = 16000) -> tuple:
+def _is_conformant(audio_info: dict, target_sample_rate: int) -> bool:
+    """
+    音频是否已是目标采样率的单声道PCM，可直接交给模型读取而无需转换
+
+    参数:
+        audio_info (dict): get_audio_info 的返回值
+        target_sample_rate (int): 目标采样率
+
+    返回:
+        bool: 无需转换时返回True
+    """
+    return (audio_info.get('sample_rate', 0) == target_sample_rate
+            and audio_info.get('channels') == 1
+            and audio_info.get('codec', '').startswith('pcm'))
+
+
+def preprocess_audio_if_needed(input_file: str, target_sample_rate: int = 16000, use_cache: bool = False) -> tuple:
     """
     如果需要，预处理音频文件到目标采样率
     
     参数:
         input_file (str): 输入音频文件路径
         target_sample_rate (int): 目标采样率，默认16000
+        use_cache (bool): 是否使用CACHE_DIR下的持久缓存，适用于训练/实验中反复处理同一批文件；
+            命中时只需一次stat。常驻服务处理的是一次性上传文件，保持默认关闭
         
     返回:
         tuple: (processed_file_path, is_temp_file)
             - processed_file_path: 处理后的文件路径
-            - is_temp_file: 是否为临时文件（需要后续清理）
+            - is_temp_file: 是否为临时文件（需要后续清理；缓存文件不是临时文件）
     """
+    temp_file = None
     try:
-        # 检查ffmpeg是否可用
-        if not check_ffmpeg_available():
+        # libsndfile可解码的格式在进程内转换，不依赖ffmpeg；其余格式在ffmpeg不可用时跳过
+        if not check_ffmpeg_available() and not input_file.lower().endswith(HEADER_READABLE_EXTENSIONS):
             logger.warning("ffmpeg不可用，跳过音频预处理")
             return input_file, False
         
+        # 命中持久缓存时直接返回，不再探测与转换
+        cache_file = _cache_path_for(input_file, target_sample_rate) if use_cache else None
+        if cache_file is not None and cache_file.exists():
+            logger.debug("命中音频转换缓存: {}", cache_file)
+            return str(cache_file), False
+        
         # 获取音频信息
         audio_info = get_audio_info(input_file)
         current_sample_rate = audio_info.get('sample_rate', 0)
         
-        # 如果当前采样率已经是目标采样率，直接返回原文件
-        if current_sample_rate == target_sample_rate:
-            logger.info(f"音频采样率已经是{target_sample_rate}Hz，跳过转换")
+        # 如果已经是目标采样率的单声道PCM，直接返回原文件（立体声或mp3等压缩格式即使采样率相同也需要转换）
+        if _is_conformant(audio_info, target_sample_rate):
+            logger.debug("音频已是{}Hz单声道PCM，跳过转换", target_sample_rate)
             return input_file, False
         
-        # 需要转换采样率
-        logger.info(f"音频采样率为{current_sample_rate}Hz，需要转换为{target_sample_rate}Hz")
+        # 需要转换采样率/声道/编码
+        logger.debug("音频为{}Hz、{}声道、{}编码，需要转换为{}Hz单声道PCM", current_sample_rate,
+                     audio_info.get('channels', 0), audio_info.get('codec', 'unknown'), target_sample_rate)
+        
+        if cache_file is not None:
+            # 先转换到缓存目录内的临时文件再原子重命名，并发进程不会读到写了一半的缓存
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            fd, temp_file = tempfile.mkstemp(prefix='temp_16k_', suffix='.wav', dir=cache_file.parent)
+            os.close(fd)
+            convert_audio_to_16k(input_file, temp_file)
+            os.replace(temp_file, cache_file)
+            return str(cache_file), False
         
         # 创建临时文件进行转换
-        input_path = Path(input_file)
-        temp_dir = os.path.dirname(input_file)
-        temp_file = os.path.join(temp_dir, f"temp_16k_{input_path.stem}.wav")
+        temp_file = _temp_path_for(input_file, _expected_output_size(input_file, audio_info, target_sample_rate))
         
         # 执行转换
         converted_file = convert_audio_to_16k(input_file, temp_file)
@@ -197,20 +501,83 @@ def preprocess_audio_if_needed(input_file: str, target_sample_rate: int = 16000)
         
     except Exception as e:
         logger.error(f"音频预处理失败: {e}")
+        if temp_file:
+            cleanup_temp_file(temp_file)
         # 如果预处理失败，返回原文件
         return input_file, False
 
 
+def load_audio_if_needed(input_file: str, target_sample_rate: int = 16000):
+    """
+    如果需要，把音频转换为目标采样率的单声道波形并直接返回，不写临时文件
+
+    参数:
+        input_file (str): 输入音频文件路径
+        target_sample_rate (int): 目标采样率，默认16000
+
+    返回:
+        np.ndarray: 转换后的单声道float32波形；音频已符合要求或转换失败时返回None，由调用方直接读取原文件
+    """
+    try:
+        # libsndfile可解码的格式在进程内转换，不依赖ffmpeg；其余格式在ffmpeg不可用时跳过
+        if not check_ffmpeg_available() and not input_file.lower().endswith(HEADER_READABLE_EXTENSIONS):
+            logger.warning("ffmpeg不可用，跳过音频预处理")
+            return None
+
+        audio_info = get_audio_info(input_file)
+        if _is_conformant(audio_info, target_sample_rate):
+            logger.debug("音频已是{}Hz单声道PCM，跳过转换", target_sample_rate)
+            return None
+
+        logger.debug("音频为{}Hz、{}声道、{}编码，转换为{}Hz单声道波形", audio_info.get('sample_rate', 0),
+                     audio_info.get('channels', 0), audio_info.get('codec', 'unknown'), target_sample_rate)
+        return convert_audio_to_16k_stream(input_file, target_sample_rate)
+
+    except Exception as e:
+        logger.error(f"音频预处理失败: {e}")
+        return None
+
+
+def mark_temp_file(file_path: str):
+    """
+    登记临时文件，延迟到 cleanup_temp_files() 或进程退出时统一删除，不在逐文件处理路径上做删除
+
+    适用于批处理/训练等短生命周期进程；常驻服务应在每个请求结束时调用 cleanup_temp_file 及时释放空间
+
+    参数:
+        file_path (str): 临时文件路径
+    """
+    _temp_files.add(file_path)
+
+
+def cleanup_temp_files():
+    """删除所有已登记、尚未清理的临时文件"""
+    while _temp_files:
+        file_path = _temp_files.pop()
+        try:
+            os.unlink(file_path)
+        except OSError:
+            pass
+
+
 def cleanup_temp_file(file_path: str):
     """
-    清理临时文件
+    立即清理临时文件
     
     参数:
         file_path (str): 要清理的文件路径
     """
+    if 'temp_16k_' not in os.path.basename(file_path):
+        return
+    _temp_files.discard(file_path)
     try:
-        if os.path.exists(file_path) and 'temp_16k_' in os.path.basename(file_path):
-            os.remove(file_path)
-            logger.info(f"已清理临时文件: {file_path}")
+        # 直接删除，不存在时忽略，省去一次stat
+        os.remove(file_path)
+        logger.debug("已清理临时文件: {}", file_path)
+    except FileNotFoundError:
+        pass
     except Exception as e:
         logger.warning(f"清理临时文件失败: {e}")
+
+
+atexit.register(cleanup_temp_files)
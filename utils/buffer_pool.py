@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+缓冲区池模块
+功能：按2的幂容量复用NumPy工作数组，减少每个请求在波形、频谱等大数组上的分配开销
+作者：天聪语音智能软件公司
+"""
+
+import threading
+from collections import defaultdict, deque
+
+import numpy as np
+
+
+class BufferPool:
+    """
+    NumPy缓冲区池
+
+    按元素个数向上取整到2的幂分配一维底层数组（slab），get()返回其前n个元素reshape后的视图，
+    put()归还视图时回收底层数组。不同长度的音频可以命中同一容量的slab。空闲数组总字节数受max_bytes限制，
+    超出预算的数组直接释放，避免偶发的超长音频把大slab长期留在池中。线程安全。
+    """
+
+    def __init__(self, max_per_size: int = 4, min_size: int = 1024, max_bytes: int = 256 << 20):
+        """
+        参数:
+            max_per_size (int): 每种容量最多缓存的空闲数组数，超出部分直接释放
+            min_size (int): 最小分配元素数
+            max_bytes (int): 所有空闲数组的总字节数上限，超出部分直接释放
+        """
+        self.max_per_size = max_per_size
+        self.min_size = min_size
+        self.max_bytes = max_bytes
+        self._free_bytes = 0
+        self._free = defaultdict(deque)
+        self._lock = threading.Lock()
+
+    def _capacity(self, n: int) -> int:
+        return max(self.min_size, 1 << max(0, n - 1).bit_length())
+
+    def get(self, shape, dtype=np.float32) -> np.ndarray:
+        """
+        取出一个未初始化的数组
+
+        参数:
+            shape (tuple): 数组形状
+            dtype: 数据类型
+
+        返回:
+            np.ndarray: 指定形状的数组（内容未初始化，需要时自行fill）
+        """
+        n = int(np.prod(shape))
+        key = (self._capacity(n), np.dtype(dtype))
+        with self._lock:
+            free = self._free[key]
+            slab = free.pop() if free else None
+            if slab is not None:
+                self._free_bytes -= slab.nbytes
+        if slab is None:
+            slab = np.empty(key[0], dtype=dtype)
+        return slab[:n].reshape(shape)
+
+    def put(self, arr: np.ndarray):
+        """
+        归还由get()取出的数组
+
+        参数:
+            arr (np.ndarray): get()返回的数组
+        """
+        slab = arr.base if arr.base is not None else arr
+        key = (slab.size, slab.dtype)
+        with self._lock:
+            free = self._free[key]
+            if len(free) < self.max_per_size and self._free_bytes + slab.nbytes <= self.max_bytes:
+                free.append(slab)
+                self._free_bytes += slab.nbytes
+
+
+# 进程内共享的缓冲区池
+BUFFER_POOL = BufferPool()
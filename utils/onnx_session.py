@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+ONNX推理会话模块
+功能：统一创建ONNX Runtime推理会话（图优化、线程与内存池配置），并基于IOBinding执行流式推理
+作者：天聪语音智能软件公司
+"""
+
+import os
+import queue
+from contextlib import contextmanager
+import numpy as np
+import onnxruntime
+
+
+def find_model_file(*candidates):
+    """
+    按优先级查找存在的模型文件
+
+    参数:
+        *candidates (str): 候选模型文件路径，靠前的优先
+
+    返回:
+        str: 第一个存在的模型文件路径，均不存在时返回None
+    """
+    for model_file in candidates:
+        if os.path.exists(model_file):
+            return model_file
+    return None
+
+
+# 导出的模型精度档次（文件名后缀），靠前的优先：离线图优化后的INT8、INT8、FP32
+MODEL_TIERS = ('_int8_opt', '_int8', '_simple')
+
+
+def find_model_pair(prefix: str, chunk_size: int = 8, tiers=MODEL_TIERS):
+    """
+    从同一精度档次中选取单帧模型与分块模型
+
+    两个模型在流式推理中共享缓存，混用不同档次会让分块/尾帧交界处的数值发生变化，
+    因此取第一个两者都存在的档次；没有时只使用单帧模型（取第一个存在的档次）
+
+    参数:
+        prefix (str): 模型文件路径前缀，如 "stream/onnx_models/pytorch_model"
+        chunk_size (int): 分块模型一次处理的帧数
+        tiers (tuple): 精度档次后缀，靠前的优先
+
+    返回:
+        tuple: (单帧模型路径, 分块模型路径)，分块模型不可用时为None；单帧模型均不存在时为 (None, None)
+    """
+    for tier in tiers:
+        model_file = f"{prefix}{tier}.onnx"
+        chunk_model_file = f"{prefix}_chunk{chunk_size}{tier}.onnx"
+        if os.path.exists(model_file) and os.path.exists(chunk_model_file):
+            return model_file, chunk_model_file
+    return find_model_file(*(f"{prefix}{tier}.onnx" for tier in tiers)), None
+
+
+def create_session_options(intra_op_num_threads=None) -> onnxruntime.SessionOptions:
+    """
+    构建推理会话配置
+
+    参数:
+        intra_op_num_threads (int, optional): intra-op线程数，未指定时取物理核数；多进程部署时按进程数分摊
+
+    返回:
+        onnxruntime.SessionOptions: 开启全部图优化、内存复用，intra-op线程数取物理核数
+    """
+    so = onnxruntime.SessionOptions()
+    # 启用全部图优化（Conv+Add+Relu等算子融合）
+    so.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    so.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    # 逻辑核数的一半近似物理核数
+    so.intra_op_num_threads = intra_op_num_threads or max(1, (os.cpu_count() or 2) // 2)
+    so.add_session_config_entry("session.intra_op.allow_spinning", "1")
+    # 跨run()调用复用内存规划与CPU内存池，避免逐帧malloc/free
+    so.enable_mem_pattern = True
+    so.enable_cpu_mem_arena = True
+    # 保持权重预打包开启，回退到CPU执行时仍使用预打包的GEMM权重
+    so.add_session_config_entry("session.disable_prepacking", "0")
+    return so
+
+
+def resolve_providers(providers=None) -> list:
+    """
+    解析执行提供者列表，过滤掉当前onnxruntime不支持的提供者，并始终以CPU兜底
+
+    参数:
+        providers (str | list, optional): 逗号分隔的字符串或列表，未指定时读取环境变量 ORT_PROVIDERS，
+            例如 "CUDAExecutionProvider,CPUExecutionProvider"、"DmlExecutionProvider,CPUExecutionProvider"、
+            "OpenVINOExecutionProvider,CPUExecutionProvider"
+
+    返回:
+        list: 可用的执行提供者，按优先级排列
+    """
+    if providers is None:
+        providers = os.environ.get("ORT_PROVIDERS", "")
+    if isinstance(providers, str):
+        providers = [p.strip() for p in providers.split(",") if p.strip()]
+    available = onnxruntime.get_available_providers()
+    selected = [p for p in providers if p in available]
+    if 'CPUExecutionProvider' not in selected:
+        selected.append('CPUExecutionProvider')
+    return selected
+
+
+def create_session(model_file: str, providers=None, intra_op_num_threads=None) -> onnxruntime.InferenceSession:
+    """
+    创建ONNX推理会话
+
+    参数:
+        model_file (str): ONNX模型文件路径
+        providers (str | list, optional): 执行提供者，见 resolve_providers
+        intra_op_num_threads (int, optional): intra-op线程数，见 create_session_options
+
+    返回:
+        onnxruntime.InferenceSession: 推理会话
+    """
+    return onnxruntime.InferenceSession(model_file, create_session_options(intra_op_num_threads),
+                                        providers=resolve_providers(providers))
+
+
+# 模型流式缓存的名称与形状：(输入名, 输出名, 形状)
+CACHE_SPECS = [
+    ('conv_cache', 'conv_cache_out', (2, 1, 16, 16, 33)),  # 卷积层缓存
+    ('tra_cache', 'tra_cache_out', (2, 3, 1, 1, 16)),      # Transformer缓存
+    ('inter_cache', 'inter_cache_out', (2, 1, 33, 16)),    # 中间层缓存
+]
+
+
+class StreamRunner:
+    """
+    流式推理执行器
+
+    使用IOBinding把输入/输出绑定到预分配的缓冲区：两组缓存以乒乓方式交替，
+    上一次调用的输出缓存直接作为下一次调用的输入缓存，逐帧推理不再分配ndarray，
+    也省去ORT对输入的拷贝。单帧模型与分块模型共享同一组缓存。
+    """
+
+    def __init__(self, session, chunk_session=None):
+        """
+        参数:
+            session (InferenceSession): 单帧模型会话
+            chunk_session (InferenceSession, optional): 分块模型会话
+        """
+        self.caches = [[np.zeros(shape, dtype=np.float32) for _, _, shape in CACHE_SPECS] for _ in range(2)]
+        cache_values = [[onnxruntime.OrtValue.ortvalue_from_numpy(c) for c in caches] for caches in self.caches]
+        self.cur = 0  # 当前保存最新缓存的缓冲区下标
+
+        # 按每次调用的帧数索引：帧数 -> (会话, mix缓冲区, enh缓冲区, [0->1绑定, 1->0绑定])
+        self.bound = {}
+        for sess in (session, chunk_session):
+            if sess is None:
+                continue
+            num_frames = sess.get_inputs()[0].shape[2]
+            mix = np.zeros((1, 257, num_frames, 2), dtype=np.float32)
+            enh = np.zeros_like(mix)
+            ios = []
+            for src in (0, 1):
+                io = sess.io_binding()
+                io.bind_ortvalue_input('mix', onnxruntime.OrtValue.ortvalue_from_numpy(mix))
+                io.bind_ortvalue_output('enh', onnxruntime.OrtValue.ortvalue_from_numpy(enh))
+                for (in_name, out_name, _), src_v, dst_v in zip(CACHE_SPECS, cache_values[src], cache_values[1 - src]):
+                    io.bind_ortvalue_input(in_name, src_v)
+                    io.bind_ortvalue_output(out_name, dst_v)
+                ios.append(io)
+            self.bound[num_frames] = (sess, mix, enh, ios)
+
+    def reset(self):
+        """清零缓存，开始处理新的音频"""
+        for caches in self.caches:
+            for c in caches:
+                c.fill(0)
+        self.cur = 0
+
+    def run(self, frames, out=None):
+        """
+        推理一帧或一块
+
+        参数:
+            frames (np.ndarray): 按帧优先排列的输入频谱，形状 (N, 257, 2)，N为1或分块帧数
+            out (np.ndarray, optional): 输出频谱写入位置，形状同frames
+
+        返回:
+            np.ndarray: out；未指定out时返回执行器的输出缓冲区（模型布局 (1, 257, N, 2)，下次调用时会被覆盖）
+        """
+        sess, mix, enh, ios = self.bound[frames.shape[0]]
+        # 模型输入布局为 (1, 257, N, 2)；N=1时两种布局内存一致，转置拷贝即为顺序拷贝
+        mix[0] = frames.transpose(1, 0, 2)
+        sess.run_with_iobinding(ios[self.cur])
+        self.cur = 1 - self.cur
+        if out is None:
+            return enh
+        out[...] = enh[0].transpose(1, 0, 2)
+        return out
+
+    def steps(self, num_frames):
+        """
+        切分推理步：整块的帧交给分块模型，不足一块的尾帧逐帧推理
+
+        参数:
+            num_frames (int): 总帧数
+
+        返回:
+            list: [(起始帧, 帧数), ...]
+        """
+        n = max(self.bound)
+        n_chunked = num_frames - num_frames % n
+        return [(i, n) for i in range(0, n_chunked, n)] + [(i, 1) for i in range(n_chunked, num_frames)]
+
+
+def create_runner_pool(session, chunk_session=None, size=1) -> queue.Queue:
+    """
+    预先构建一组流式推理执行器，跨请求复用缓存与IOBinding缓冲区
+
+    参数:
+        session (InferenceSession): 单帧模型会话
+        chunk_session (InferenceSession, optional): 分块模型会话
+        size (int): 执行器数量，即可同时推理的请求数
+
+    返回:
+        queue.Queue: 执行器池
+    """
+    pool = queue.Queue()
+    for _ in range(size):
+        pool.put(StreamRunner(session, chunk_session))
+    return pool
+
+
+@contextmanager
+def acquire_runner(pool: queue.Queue):
+    """
+    从执行器池取出一个执行器并清零缓存，用完后归还；池空时阻塞等待
+
+    参数:
+        pool (queue.Queue): create_runner_pool 创建的执行器池
+    """
+    runner = pool.get()
+    try:
+        runner.reset()
+        yield runner
+    finally:
+        pool.put(runner)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+STFT/ISTFT模块
+功能：基于NumPy的短时傅里叶变换及其逆变换，输出与ONNX模型一致的实部/虚部频谱
+作者：天聪语音智能软件公司
+"""
+
+import numpy as np
+import soundfile as sf
+from librosa import istft as librosa_istft
+from numba import njit
+
+from utils.buffer_pool import BUFFER_POOL
+
+N_FFT = 512
+HOP_LENGTH = 256
+PAD = N_FFT // 2
+# 从文件分块计算STFT时每块的帧数
+STFT_BLOCK_FRAMES = 512
+
+# STFT分析窗：周期平方根汉宁窗，与 torch.hann_window(512).pow(0.5) 一致
+ANALYSIS_WIN = (np.hanning(N_FFT + 1)[:-1] ** 0.5).astype(np.float32)
+# ISTFT合成窗：对称平方根汉宁窗
+SYNTH_WIN = (np.hanning(N_FFT) ** 0.5).astype(np.float32)
+
+
+# 不开启parallel：分帧循环很小，且与ORT线程池、请求级线程并发运行，numba的workqueue线程层不支持并发调用
+@njit(fastmath=True, cache=True)
+def _frame_and_window(seg, seg_start, n, win, hop, t0, out):
+    """
+    分帧并加窗：seg为原信号[seg_start, seg_start+len(seg))段，原信号长n，
+    第t0帧起的out.shape[0]帧写入out；反射填充在索引时完成，不生成填充后的信号副本
+    """
+    pad = win.shape[0] // 2
+    for b in range(out.shape[0]):
+        start = (t0 + b) * hop - pad
+        for k in range(win.shape[0]):
+            j = start + k
+            if j < 0:
+                j = -j
+            elif j >= n:
+                j = 2 * (n - 1) - j
+            out[b, k] = seg[j - seg_start] * win[k]
+
+
+def _frame_block(seg, seg_start, n, t0, out):
+    """
+    分帧并加窗（center=True，反射填充）
+
+    参数:
+        seg (np.ndarray): 原信号 [seg_start, seg_start+len(seg)) 段，需覆盖所需帧及反射来源样本
+        seg_start (int): seg在原信号中的起始位置
+        n (int): 原信号总长度
+        t0 (int): 起始帧号
+        out (np.ndarray): 输出帧缓冲区，形状 (B, n_fft)
+    """
+    _frame_and_window(seg, seg_start, n, ANALYSIS_WIN, HOP_LENGTH, t0, out)
+
+
+def num_frames(num_samples: int) -> int:
+    """center=True时STFT的帧数"""
+    return 1 + num_samples // HOP_LENGTH
+
+
+def _check_length(n: int):
+    """反射填充要求信号长度大于填充长度，否则按索引反射会越界读取（与 torch.stft 一样报错）"""
+    if n <= PAD:
+        raise ValueError(f"音频过短：{n}个样本，至少需要{PAD + 1}个样本")
+
+
+def _write_spec(frames, out):
+    spec = np.fft.rfft(frames, n=N_FFT, axis=-1)
+    out[..., 0] = spec.real
+    out[..., 1] = spec.imag
+
+
+def stft(wav: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    短时傅里叶变换（center=True，反射填充，与 torch.stft 默认行为一致）
+
+    参数:
+        wav (np.ndarray): 单声道float32时域信号
+        out (np.ndarray, optional): 预分配的输出缓冲区，形状 (T, 257, 2)
+
+    返回:
+        np.ndarray: 按帧优先排列的频谱，形状 (T, 257, 2)，最后一维为[实部, 虚部]
+
+    异常:
+        ValueError: 信号不超过PAD个样本时抛出
+    """
+    _check_length(len(wav))
+    T = num_frames(len(wav))
+    if out is None:
+        out = np.empty((T, N_FFT // 2 + 1, 2), dtype=np.float32)
+    frames = BUFFER_POOL.get((T, N_FFT))
+    try:
+        _frame_block(wav, 0, len(wav), 0, frames)
+        _write_spec(frames, out)
+    finally:
+        BUFFER_POOL.put(frames)
+    return out
+
+
+def stft_file(f: sf.SoundFile, out: np.ndarray = None, block_frames: int = STFT_BLOCK_FRAMES) -> np.ndarray:
+    """
+    从已打开的单声道音频文件分块读取并计算STFT，不一次性读入整段波形，
+    内存占用与块大小相关而与音频时长无关（输出频谱除外）
+
+    参数:
+        f (sf.SoundFile): 已打开的音频文件
+        out (np.ndarray, optional): 预分配的输出缓冲区，形状 (T, 257, 2)，T = num_frames(f.frames)
+        block_frames (int): 每块的帧数
+
+    返回:
+        np.ndarray: 按帧优先排列的频谱，形状 (T, 257, 2)
+
+    异常:
+        ValueError: 音频不超过PAD个样本（含空文件）时抛出
+    """
+    n = f.frames
+    _check_length(n)
+    T = num_frames(n)
+    if out is None:
+        out = np.empty((T, N_FFT // 2 + 1, 2), dtype=np.float32)
+    frames = BUFFER_POOL.get((block_frames, N_FFT))
+    # 每块读取范围向两侧多读PAD个样本，保证反射填充的来源样本在块内
+    seg_buf = BUFFER_POOL.get(((block_frames - 1) * HOP_LENGTH + N_FFT + 2 * PAD,))
+    try:
+        for t0 in range(0, T, block_frames):
+            t1 = min(T, t0 + block_frames)
+            lo = t0 * HOP_LENGTH - PAD
+            hi = (t1 - 1) * HOP_LENGTH - PAD + N_FFT
+            r0, r1 = max(0, lo - PAD), min(n, hi + PAD)
+            f.seek(r0)
+            seg = f.read(r1 - r0, dtype='float32', out=seg_buf[:r1 - r0])
+            _frame_block(seg, r0, n, t0, frames[:t1 - t0])
+            _write_spec(frames[:t1 - t0], out[t0:t1])
+    finally:
+        BUFFER_POOL.put(frames)
+        BUFFER_POOL.put(seg_buf)
+    return out
+
+
+def istft(spec: np.ndarray, out: np.ndarray = None) -> np.ndarray:
+    """
+    逆短时傅里叶变换
+
+    参数:
+        spec (np.ndarray): 按帧优先排列的频谱，形状 (T, 257, 2)
+        out (np.ndarray, optional): 预分配的float32输出缓冲区，长度为 hop*(T-1)
+
+    返回:
+        np.ndarray: 时域信号
+    """
+    if out is None:
+        out = np.empty(HOP_LENGTH * (spec.shape[0] - 1), dtype=np.float32)
+    # 最后一维[实部, 虚部]连续存放，直接按complex64重新解释，不生成复数临时数组
+    complex_spec = np.ascontiguousarray(spec, dtype=np.float32).view(np.complex64)[..., 0].T
+    librosa_istft(complex_spec, n_fft=N_FFT, hop_length=HOP_LENGTH, win_length=N_FFT, window=SYNTH_WIN, out=out)
+    return out